@@ -0,0 +1,166 @@
+'''
+monte carlo balancing: plays thousands of headless games per level config with
+bot players of several typing speeds across a process pool, and tabulates win
+rate, time to finish and the mean score over time for each (config, wpm)
+
+    python balance.py --games 200                                # the shipped level table
+    python balance.py --config hard=150,100,1.5 --config hard=150,120,2 --wpm 40 60 80
+'''
+import argparse
+import multiprocessing as mp
+import os
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from bot import Bot
+from engine import GameEngine, Levels
+from vocabulary import get_vocabulary
+
+_CHECKPOINTS = (15, 30, 60, 120, 240)  # game seconds the score trajectory is sampled at
+_MAX_SECONDS = 300  # a game still running by then counts as a timeout
+
+
+class LevelConfig:
+    '''
+    one row of GameEngine._level_config_table, under a name for the tables
+    '''
+    def __init__(self, level: Levels, max_score: int, speed: float, generate_cycle: float):
+        self.level = level
+        self.max_score = max_score
+        self.speed = speed
+        self.generate_cycle = generate_cycle
+
+    @property
+    def name(self):
+        return f"{self.level.value} {self.max_score}/{self.speed:g}/{self.generate_cycle:g}"
+
+    @classmethod
+    def defaults(cls):
+        return [cls(level, *config) for level, config in GameEngine._level_config_table.items()]
+
+    @classmethod
+    def parse(cls, text: str):
+        # "hard=150,120,1.5": level=max_score,speed,generate_cycle
+        level, _, values = text.partition('=')
+        max_score, speed, generate_cycle = values.split(',')
+        return cls(Levels(level), int(max_score), float(speed), float(generate_cycle))
+
+    def apply(self, engine: GameEngine):
+        engine.set_level(self.level)
+        engine.max_score = self.max_score
+        engine.board.speed = self.speed
+        engine.board.generate_cycle = self.generate_cycle
+
+
+def play(task: Tuple[int, int, LevelConfig, float, List[int], float, float, int]):
+    '''
+    one game, in a pool worker. returns the cell it belongs to, the outcome, the game
+    time it ended at and the score at every checkpoint (the final score once it ended)
+    '''
+    config_idx, wpm_idx, config, wpm, seeds, error_rate, max_seconds, tick_rate = task
+    engine_seed, bot_seed = seeds
+
+    engine = GameEngine(config.level)
+    config.apply(engine)
+    engine.reset(engine_seed)
+    bot = Bot(engine, wpm, error_rate, rng=np.random.default_rng(bot_seed))
+
+    dt = 1/tick_rate
+    trajectory = []
+    is_over = False
+    while not is_over and engine.now < max_seconds:
+        bot.step(dt)
+        is_over = engine.step(dt)
+        if len(trajectory) < len(_CHECKPOINTS) and engine.now >= _CHECKPOINTS[len(trajectory)]:
+            trajectory.append(engine.info_table.score)
+
+    score = engine.info_table.score
+    trajectory += [score]*(len(_CHECKPOINTS) - len(trajectory))
+    outcome = "timeout" if not is_over else "won" if score >= engine.max_score else "lost"
+    return config_idx, wpm_idx, outcome, engine.now, trajectory
+
+
+def simulate(configs: List[LevelConfig], wpms: List[float], games: int, error_rate: float=0.03, seed: int=0,
+             workers: int=None, max_seconds: float=_MAX_SECONDS, tick_rate: int=30):
+    '''
+    returns {(config idx, wpm idx): summary}. every game's seeds derive from
+    (seed, config, wpm, game), so results do not depend on the pool's scheduling
+    '''
+    tasks = []
+    for config_idx, config in enumerate(configs):
+        for wpm_idx, wpm in enumerate(wpms):
+            for game in range(games):
+                seeds = np.random.SeedSequence([seed, config_idx, wpm_idx, game]).generate_state(2).tolist()
+                tasks.append((config_idx, wpm_idx, config, wpm, seeds, error_rate, max_seconds, tick_rate))
+
+    get_vocabulary()  # build a cold cache here once, not in every worker at the same time
+    outcomes = {}
+    with mp.Pool(workers or os.cpu_count()) as pool:
+        for config_idx, wpm_idx, outcome, time, trajectory in pool.imap_unordered(play, tasks, chunksize=8):
+            outcomes.setdefault((config_idx, wpm_idx), []).append((outcome, time, trajectory))
+    return {cell: summarize(results) for cell, results in sorted(outcomes.items())}
+
+def summarize(results: List[Tuple[str, float, List[int]]]):
+    won_times = np.array([time for outcome, time, _ in results if outcome == "won"])
+    lost_times = np.array([time for outcome, time, _ in results if outcome == "lost"])
+    trajectories = np.array([trajectory for _, _, trajectory in results], dtype=np.float64)
+    return {
+        "games": len(results),
+        "won": len(won_times)/len(results),
+        "lost": len(lost_times)/len(results),
+        "timeout": 1 - (len(won_times) + len(lost_times))/len(results),
+        "win_time_median": float(np.median(won_times)) if len(won_times) else None,
+        "win_time_p90": float(np.percentile(won_times, 90)) if len(won_times) else None,
+        "loss_time_median": float(np.median(lost_times)) if len(lost_times) else None,
+        "score_mean": trajectories.mean(axis=0).tolist(),
+    }
+
+
+def format_tables(configs: List[LevelConfig], wpms: List[float], summaries: Dict):
+    seconds = lambda value: "-" if value is None else f"{value:.0f}s"
+    lines = []
+    for config_idx, config in enumerate(configs):
+        lines.append(f"\n{config.name}  (max_score/speed px/sec/generate_cycle sec)")
+        lines.append(
+            f"{'wpm':>5} {'games':>6} {'won':>6} {'lost':>6} {'timeout':>8} {'win t50':>8} {'win t90':>8} {'loss t50':>9} | "
+            + " ".join(f"{f'@{t}s':>6}" for t in _CHECKPOINTS)
+        )
+        for wpm_idx, wpm in enumerate(wpms):
+            row = summaries.get((config_idx, wpm_idx))
+            if row is None:
+                continue
+            lines.append(
+                f"{wpm:>5g} {row['games']:>6} {row['won']:>6.0%} {row['lost']:>6.0%} {row['timeout']:>8.0%} "
+                f"{seconds(row['win_time_median']):>8} {seconds(row['win_time_p90']):>8} {seconds(row['loss_time_median']):>9} | "
+                + " ".join(f"{score:>6.1f}" for score in row["score_mean"])
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", action="append", metavar="LEVEL=MAX,SPEED,CYCLE", default=None,
+                        help="a level config to try, repeatable; the shipped table when omitted")
+    parser.add_argument("--wpm", type=float, nargs='+', default=[30, 45, 60, 80, 100])
+    parser.add_argument("--games", type=int, default=100, help="per config and wpm")
+    parser.add_argument("--error-rate", type=float, default=0.03)
+    parser.add_argument("--max-seconds", type=float, default=_MAX_SECONDS, help="game seconds before a game times out")
+    parser.add_argument("--tick-rate", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configs = [LevelConfig.parse(text) for text in args.config] if args.config else LevelConfig.defaults()
+    start = perf_counter()
+    summaries = simulate(configs, args.wpm, args.games, args.error_rate, args.seed, args.workers, args.max_seconds, args.tick_rate)
+    elapsed = perf_counter() - start
+
+    print(format_tables(configs, args.wpm, summaries))
+    total = len(configs)*len(args.wpm)*args.games
+    print(f"\n{total} games in {elapsed:.1f}s on {args.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
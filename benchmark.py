@@ -0,0 +1,174 @@
+'''
+benchmark of the per-frame update path: GameEngine.step (board, towers,
+collision, score) plus the board, tower and GameInfo views, on SDL's dummy
+video driver.
+
+    python benchmark.py                               # run every scenario
+    python benchmark.py --scenario dense --frames 3000
+    python benchmark.py --save-baseline               # store results as the baseline
+    python benchmark.py --compare                     # fail on p95 regressions against it
+'''
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import sys
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+import pygame
+
+from components import text_width
+from engine import GameEngine, Levels
+from items import BoardView, GameInfo, Item, TowerView
+from utils import get_word, get_word_id
+
+_BASELINE_PATH = "./bench_baseline.json"
+_TICK = 1/60
+_SCREEN_SIZE = (1000, 500)
+
+_SCENARIOS = {
+    # words on board at start, towers re-issued when they expire, typed chars per sec
+    "sparse": dict(level=Levels.easy, prefill=0, towers=0, typing_speed=4, frames=1800),
+    "dense": dict(level=Levels.hard, prefill=40, towers=0, typing_speed=6, frames=1800),
+    "towers": dict(level=Levels.hard, prefill=20, towers=10, typing_speed=6, frames=1800),
+    "long": dict(level=Levels.medium, prefill=10, towers=3, typing_speed=5, frames=18000),
+}
+
+
+class ScriptedSession:
+    def __init__(self, level: Levels, prefill: int, towers: int, typing_speed: float, seed: int=0):
+        self.engine = GameEngine(level)
+        self.engine.reset(seed)
+        self.engine.max_score = float("inf")  # keep the session running
+        self.engine.info_table.score = 10**6  # enough for every tower
+
+        surface = pygame.Surface(_SCREEN_SIZE)
+        Item.set_display_serf(surface)
+        self.board_view = BoardView(self.engine.board, (0, 10), _SCREEN_SIZE[0])
+        self.tower_view = TowerView(self.engine.tower_manager)
+        self.game_info = GameInfo((670, _SCREEN_SIZE[1] - 40))
+
+        self._towers = towers
+        self._type_interval = max(int(1/(typing_speed*_TICK)), 1)
+        self._keys = []
+        self._frame = 0
+
+        board = self.engine.board
+        for i in range(prefill):
+            line = board.lines[i % len(board.lines)]
+            word_id = get_word_id(board.rng)
+            text = get_word(word_id)
+            x = board._LINE_BOUNDRY*(1 - (i//len(board.lines) + 1)/(prefill//len(board.lines) + 2))
+            line.add_word(word_id, text, text_width(text), board.speed, x)
+
+    def _script_keys(self):
+        # re-issue the towers, then type the word closest to the boundry one key at a time
+        for i in range(self._towers):
+            if not self.engine.board.lines[i].have_tower(self.engine.now):
+                return list(f"/tower {i + 1}\n")
+
+        board = self.engine.board
+        heads = [slot for slot in board.first_words if slot is not None]
+        if not heads:
+            return []
+        target = max(heads, key=lambda slot: board.words.x[slot])
+        return list(board.word_text(target))
+
+    def frame(self):
+        if self._frame % self._type_interval == 0:
+            if not self._keys:
+                self._keys = self._script_keys()
+            if self._keys:
+                self.engine.read_key(self._keys.pop(0))
+        self._frame += 1
+
+        self.engine.step(_TICK)
+        self.board_view.update()
+        self.tower_view.update(self.engine.now)
+        self.game_info.update(self.engine.info_table, self.engine.now)
+        Item.flush_dirty_rects()
+
+
+def run_scenario(name: str, frames: int=None):
+    config = dict(_SCENARIOS[name])
+    frames = config.pop("frames") if frames is None else frames
+    config.pop("frames", None)
+
+    session = ScriptedSession(**config)
+    frame_times = np.empty(frames)
+    for i in range(frames):
+        start = perf_counter()
+        session.frame()
+        frame_times[i] = perf_counter() - start
+
+    # allocations are measured on a second, identical run, tracemalloc slows every frame
+    session = ScriptedSession(**config)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for i in range(frames):
+        session.frame()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(frame_times*1000, [50, 95, 99])
+    return {
+        "frames": frames,
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(frame_times.max()*1000), 4),
+        "retained_kb": round((after - before)/1024, 1),
+        "peak_kb": round((peak - before)/1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            old, new = baseline[name][key], result[key]
+            change = (new - old)/old if old else 0.0
+            flag = "  REGRESSION" if change > tolerance else ""
+            print(f"{name:>8} {key}: {old:8.4f} -> {new:8.4f} ({change:+.1%}){flag}")
+            if key == "p95_ms" and change > tolerance:
+                regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", action="append", choices=list(_SCENARIOS), help="default: all")
+    parser.add_argument("--frames", type=int, default=None, help="override the scenario length")
+    parser.add_argument("--baseline", default=_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown ratio")
+    args = parser.parse_args()
+
+    pygame.init()
+    results = {}
+    for name in args.scenario or list(_SCENARIOS):
+        results[name] = run_scenario(name, args.frames)
+        print(name, json.dumps(results[name]))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+'''
+synthetic players. a Bot reads the live words off a GameEngine's board, picks
+a target and types it key by key through engine.read_key, the path keyboard
+input takes, at a set wpm and error rate. wrong keys are backspaced, towers
+are bought with typed "/tower N" commands.
+
+    python bot.py --bots 200 --seconds 60             # stress the engine with 200 boards
+    python bot.py --bots 50 --wpm 40 90 --check       # run twice and compare the outcomes
+'''
+import argparse
+import hashlib
+from time import perf_counter
+from typing import List
+
+import numpy as np
+
+from components import (
+    InputBuffer,
+    RunningWord,
+    TowerManager,
+)
+from engine import GameEngine, Levels
+from utils import PygameFunction
+
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+class Strategies:
+    '''
+    target pickers, each gets the board and the live word slots
+    '''
+    @staticmethod
+    def nearest(engine: GameEngine, slots: np.ndarray):
+        # the word closest to the boundary, about to cost points
+        return int(slots[np.argmax(engine.board.words.x[slots])])
+
+    @staticmethod
+    def score(engine: GameEngine, slots: np.ndarray):
+        # the most valuable word, nearest first among equals
+        words = engine.board.words
+        return int(slots[np.lexsort((-words.x[slots], -words.score[slots]))[0]])
+
+    @staticmethod
+    def shortest(engine: GameEngine, slots: np.ndarray):
+        # the quickest word to clear
+        words = engine.board.words
+        return int(slots[np.lexsort((-words.x[slots], words.width[slots]))[0]])
+
+    @classmethod
+    def names(cls):
+        return ["nearest", "score", "shortest"]
+
+
+class Bot:
+    '''
+    one player on one engine, call step(dt) before every engine.step(dt)
+    '''
+    # a line is worth a tower once the words on it past the warning mark score this much
+    _TOWER_THREAT = 8
+    _TOWER_RESERVE = 5  # score kept after buying, so one missed word does not end the game
+
+    def __init__(self, engine: GameEngine, wpm: float=60, error_rate: float=0.02, strategy: str="nearest",
+                 towers: bool=True, jitter: float=0.3, rng: np.random.Generator=None):
+        self.engine = engine
+        self.wpm = wpm
+        self.error_rate = error_rate
+        self.pick = getattr(Strategies, strategy)
+        self.towers = towers
+        self.jitter = jitter  # spread of the time between keys, as a share of the mean
+        self.rng = np.random.default_rng() if rng is None else rng
+
+        self.target = None   # (slot, word id)
+        self.command = ""    # keys of a command still to type
+        self.keys = 0
+        self.errors = 0
+        self._next_key = 0.0  # sec until the next key
+
+    @property
+    def key_interval(self):
+        # a word is five keys
+        return 60/(self.wpm*5)
+
+    def step(self, dt: float):
+        self._next_key -= dt
+        while self._next_key <= 0:
+            key = self.next_key()
+            if key is not None:
+                self.engine.read_key(key)
+                self.keys += 1
+            self._next_key += self.key_interval*max(0.1, 1 + self.jitter*self.rng.standard_normal())
+
+    def next_key(self):
+        engine = self.engine
+        typed = engine.input_buffer.inputbox
+
+        if self.command:
+            if self.command == PygameFunction.KEY_RETURN and engine.info_table.score < TowerManager._TOWER_COST:
+                # lost points while typing it, leave command mode and erase the command instead
+                self.command = ""
+                return InputBuffer.COMMAND_PREFIX
+            key, self.command = self.command[0], self.command[1:]
+            return key
+        if engine.input_buffer.mode == InputBuffer.COMMAND_MODE:
+            return None  # the command runs on the next engine step
+
+        if self.towers and not typed:
+            line = self.tower_line()
+            if line is not None:
+                self.command = f"tower {line + 1}\n"
+                return InputBuffer.COMMAND_PREFIX
+
+        text = self.target_text()
+        if text is None:
+            return PygameFunction.KEY_BACKSPACE if typed else None
+        if not text.startswith(typed):
+            return PygameFunction.KEY_BACKSPACE  # a typo, or the target is gone
+        if typed == text:
+            return None  # matched on the next engine step
+
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            return _LETTERS[self.rng.integers(len(_LETTERS))]
+        return text[len(typed)]
+
+    def target_text(self):
+        words = self.engine.board.words
+        if self.target is not None:
+            slot, word_id = self.target
+            if not words.alive[slot] or words.word_id[slot] != word_id:
+                self.target = None  # typed by now, shot or out of bounds
+
+        if self.target is None:
+            slots = words.slots
+            if not len(slots):
+                return None
+            slot = self.pick(self.engine, slots)
+            self.target = slot, int(words.word_id[slot])
+        return self.engine.board.word_text(self.target[0])
+
+    def tower_line(self):
+        engine = self.engine
+        if engine.info_table.score < TowerManager._TOWER_COST + self._TOWER_RESERVE:
+            return None
+
+        words = engine.board.words
+        slots = words.slots
+        slots = slots[words.color[slots] != RunningWord.SAFE]
+        if not len(slots):
+            return None
+        threat = np.bincount(words.line[slots], weights=words.score[slots], minlength=len(engine.board.lines))
+        for line in np.argsort(-threat).tolist():
+            if threat[line] < self._TOWER_THREAT:
+                return None
+            if not engine.board.lines[line].have_tower(engine.now):
+                return line
+        return None
+
+
+def run_bots(bots: int, seconds: float, level: Levels=Levels.hard, wpm: List[float]=(40, 80), error_rate: float=0.03,
+             strategy: str="nearest", seed: int=0, tick_rate: int=60):
+    '''
+    steps every board together until the game time runs out, finished boards restart
+    with a fresh seed. the engine and bot seeds all derive from seed, so a run replays exactly
+    '''
+    sequence = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(sequence.spawn(1)[0])
+
+    def new_player():
+        engine = GameEngine(level)
+        engine.reset(int(rng.integers(2**32)))
+        bot = Bot(engine, float(rng.uniform(*wpm)), error_rate, strategy, rng=np.random.default_rng(rng.integers(2**32)))
+        return bot
+
+    players = [new_player() for _ in range(bots)]
+    dt = 1/tick_rate
+    ticks = int(seconds*tick_rate)
+    results = []  # (seed, wpm, score, game time, won) of every finished game
+    keys = 0
+    digest = hashlib.sha1()
+
+    start = perf_counter()
+    for _ in range(ticks):
+        for i, bot in enumerate(players):
+            bot.step(dt)
+            engine = bot.engine
+            is_over = engine.step(dt)
+            if is_over:
+                score = engine.info_table.score
+                results.append((engine.seed, bot.wpm, score, engine.now, score >= engine.max_score))
+                keys += bot.keys
+                players[i] = new_player()
+    elapsed = perf_counter() - start
+
+    for bot in players:
+        digest.update(f"{bot.engine.seed}:{bot.engine.info_table.score}:{bot.keys};".encode())
+    for result in results:
+        digest.update(repr(result).encode())
+
+    return {
+        "bots": bots,
+        "ticks_per_sec": round(ticks*bots/elapsed),
+        "realtime_factor": round(ticks*dt/elapsed, 2),
+        "keys": keys + sum(bot.keys for bot in players),
+        "finished": len(results),
+        "won": sum(result[-1] for result in results),
+        "digest": digest.hexdigest()[:16],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=60, help="game seconds per board")
+    parser.add_argument("--level", choices=[level.value for level in Levels], default=Levels.hard.value)
+    parser.add_argument("--wpm", type=float, nargs=2, metavar=("MIN", "MAX"), default=(40, 80), help="bots type at a wpm drawn from this range")
+    parser.add_argument("--error-rate", type=float, default=0.03, help="share of keys that are typos")
+    parser.add_argument("--strategy", choices=Strategies.names(), default="nearest")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="run twice and fail if the outcomes differ")
+    args = parser.parse_args()
+
+    run = lambda: run_bots(args.bots, args.seconds, Levels(args.level), args.wpm, args.error_rate, args.strategy, args.seed)
+    stats = run()
+    print(" | ".join(f"{k}: {v}" for k, v in stats.items()))
+    if args.check:
+        again = run()
+        assert again["digest"] == stats["digest"], "Error: bot runs are not reproducible"
+        print("reproducible")
+
+
+if __name__ == "__main__":
+    main()
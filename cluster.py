@@ -0,0 +1,298 @@
+'''
+sharding of headless game sessions across worker processes. every worker runs
+its own fixed-rate tick loop over the GameEngines it owns; the supervisor
+routes input to the owning worker, collects per-worker tick latency, and moves
+sessions (pickled engines) from hot workers to cool ones.
+
+    python cluster.py --workers 4 --sessions 2000
+    python cluster.py --workers 4 --sessions 2000 --skew   # start all on worker 0
+'''
+import argparse
+import multiprocessing as mp
+import os
+import pickle
+import random
+from multiprocessing.connection import Connection, wait
+from time import perf_counter
+
+import numpy as np
+
+from engine import GameEngine, Levels
+from utils import PygameFunction
+from vocabulary import get_vocabulary
+
+_REPORT_INTERVAL = 1.0  # sec
+
+
+def _worker_main(conn: Connection, dt: float):
+    engines = {}
+    tick_times = []
+    overruns = 0
+    next_tick = perf_counter()
+    next_report = next_tick + _REPORT_INTERVAL
+
+    while True:
+        # serve commands until the next tick is due
+        while True:
+            timeout = next_tick - perf_counter()
+            if timeout <= 0 or not conn.poll(timeout):
+                break
+            command, *args = conn.recv()
+
+            if command == "create":
+                session_id, level, seed = args
+                engine = GameEngine(Levels(level))
+                engine.reset(seed)
+                engines[session_id] = engine
+            elif command == "keys":
+                for session_id, keys in args[0].items():
+                    engine = engines.get(session_id)
+                    if engine is not None:
+                        for key in keys:
+                            engine.read_key(PygameFunction.KEY_BACKSPACE if key == '\b' else key)
+            elif command == "export":
+                session_id = args[0]
+                engine = engines.pop(session_id, None)
+                conn.send(("exported", session_id, None if engine is None else pickle.dumps(engine)))
+            elif command == "import":
+                session_id, state = args
+                engines[session_id] = pickle.loads(state)
+            elif command == "stop":
+                conn.close()
+                return
+
+        start = perf_counter()
+        for session_id, engine in list(engines.items()):
+            if engine.step(dt):
+                conn.send(("over", session_id, engine.info_table.score))
+                del engines[session_id]
+        now = perf_counter()
+        tick_times.append(now - start)
+
+        next_tick += dt
+        if now > next_tick:
+            overruns += 1
+            next_tick = now  # drop the missed ticks instead of bursting
+
+        if now >= next_report:
+            times = np.array(tick_times)*1000
+            conn.send(("report", {
+                "sessions": len(engines),
+                "ticks": len(tick_times),
+                "tick_mean_ms": float(times.mean()),
+                "tick_p99_ms": float(np.percentile(times, 99)),
+                "overruns": overruns,
+            }))
+            tick_times = []
+            overruns = 0
+            next_report = now + _REPORT_INTERVAL
+
+
+class WorkerHandle:
+    def __init__(self, worker_id: int, process: mp.Process, conn: Connection):
+        self.id = worker_id
+        self.process = process
+        self.conn = conn
+        self.sessions = set()
+        self.report = None
+        self.reports = 0
+        self.keys = {}  # session id -> keys, sent once per flush
+
+    @property
+    def load(self):
+        # share of the tick budget spent stepping, from the latest report
+        return 0.0 if self.report is None else self.report["load"]
+
+class Supervisor:
+    _TICK_RATE = 30
+    # load difference between the hottest and coolest worker that triggers a move,
+    # absolute and relative to the hottest so timing noise does not shuffle sessions
+    _REBALANCE_GAP = 0.15
+    _REBALANCE_RATIO = 0.25
+    _MAX_MOVES = 32        # sessions moved per rebalance
+
+    def __init__(self, workers: int=None, tick_rate: int=_TICK_RATE):
+        self.dt = 1/tick_rate
+        self.workers = []
+        get_vocabulary()  # build a cold cache here once, not in every worker at the same time
+        for i in range(workers or os.cpu_count()):
+            conn, child_conn = mp.Pipe()
+            process = mp.Process(target=_worker_main, args=(child_conn, self.dt), daemon=True)
+            process.start()
+            child_conn.close()
+            self.workers.append(WorkerHandle(i, process, conn))
+
+        self.owner = {}     # session id -> WorkerHandle
+        self.finished = {}  # session id -> final score
+        self.moves = 0
+        self._moving = {}   # session id -> keys that arrived while it moves
+        self._rebalance_after = {}  # worker id -> reports seen before the last move
+        self._next_id = 0
+
+    # routing
+
+    def create_session(self, level: Levels=Levels.easy, seed: int=None, worker: WorkerHandle=None):
+        if worker is None:
+            worker = min(self.workers, key=lambda w: (w.load, len(w.sessions)))
+        session_id = self._next_id
+        self._next_id += 1
+
+        worker.conn.send(("create", session_id, level.value, seed))
+        worker.sessions.add(session_id)
+        self.owner[session_id] = worker
+        return session_id
+
+    def send_keys(self, session_id: int, keys: str):
+        if session_id in self._moving:
+            self._moving[session_id] += keys
+            return
+        worker = self.owner.get(session_id)
+        if worker is not None:
+            worker.keys[session_id] = worker.keys.get(session_id, "") + keys
+
+    def flush(self):
+        for worker in self.workers:
+            if worker.keys:
+                worker.conn.send(("keys", worker.keys))
+                worker.keys = {}
+
+    def poll(self, timeout: float=0.0):
+        self.flush()
+        conns = {worker.conn: worker for worker in self.workers}
+        for conn in wait(list(conns), timeout):
+            worker = conns[conn]
+            while conn.poll():
+                self._handle(worker, conn.recv())
+
+    def _handle(self, worker: WorkerHandle, message):
+        kind, *args = message
+        if kind == "report":
+            report = args[0]
+            report["load"] = report["tick_mean_ms"]/(self.dt*1000)
+            worker.report = report
+            worker.reports += 1
+        elif kind == "over":
+            session_id, score = args
+            self.finished[session_id] = score
+            owner = self.owner.pop(session_id, None)  # not the sender while it moves
+            if owner is not None:
+                owner.sessions.discard(session_id)
+        elif kind == "exported":
+            session_id, state = args
+            keys = self._moving.pop(session_id, "")
+            target = self.owner.get(session_id)
+            if state is None or target is None:
+                # finished before it could move
+                if target is not None:
+                    target.sessions.discard(session_id)
+                self.owner.pop(session_id, None)
+                return
+            target.conn.send(("import", session_id, state))
+            if keys:
+                self.send_keys(session_id, keys)
+
+    # balancing
+
+    def rebalance(self):
+        reported = [worker for worker in self.workers if worker.report is not None]
+        if len(reported) < 2 or self._moving:
+            return 0
+        # wait for reports taken after the previous move
+        if any(worker.reports <= self._rebalance_after.get(worker.id, -1) for worker in reported):
+            return 0
+
+        hot = max(reported, key=lambda w: w.load)
+        cool = min(reported, key=lambda w: w.load)
+        gap = hot.load - cool.load
+        if gap < self._REBALANCE_GAP or gap < hot.load*self._REBALANCE_RATIO or len(hot.sessions) < 2:
+            return 0
+
+        # move enough sessions to meet in the middle, assuming similar cost per session
+        share = (hot.load - cool.load)/2/hot.load
+        count = min(int(len(hot.sessions)*share), self._MAX_MOVES)
+        for session_id in list(hot.sessions)[:count]:
+            hot.sessions.discard(session_id)
+            cool.sessions.add(session_id)
+            self.owner[session_id] = cool
+            self._moving[session_id] = ""
+            hot.conn.send(("export", session_id))
+
+        self.moves += count
+        self._rebalance_after = {worker.id: worker.reports for worker in reported}
+        return count
+
+    def stats(self):
+        workers = []
+        for worker in self.workers:
+            report = worker.report or {}
+            workers.append({
+                "worker": worker.id,
+                "sessions": len(worker.sessions),
+                "load": round(worker.load, 3),
+                "tick_mean_ms": round(report.get("tick_mean_ms", 0.0), 3),
+                "tick_p99_ms": round(report.get("tick_p99_ms", 0.0), 3),
+                "overruns": report.get("overruns", 0),
+            })
+        return {
+            "sessions": len(self.owner),
+            "finished": len(self.finished),
+            "moves": self.moves,
+            "worst_p99_ms": max(w["tick_p99_ms"] for w in workers),
+            "workers": workers,
+        }
+
+    def close(self):
+        for worker in self.workers:
+            worker.conn.send(("stop",))
+        for worker in self.workers:
+            worker.process.join(5)
+            worker.conn.close()
+
+
+def load_test(workers: int, sessions: int, seconds: float, keys_per_sec: float, skew: bool):
+    supervisor = Supervisor(workers)
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    first = supervisor.workers[0] if skew else None
+    for i in range(sessions):
+        supervisor.create_session(Levels.hard, seed=i, worker=first)
+
+    start = previous = perf_counter()
+    while perf_counter() - start < seconds:
+        supervisor.poll(0.01)
+        now = perf_counter()
+
+        # random typing, a wrong char is erased again
+        for _ in range(int(len(supervisor.owner)*keys_per_sec*(now - previous))):
+            session_id = rng.choice(list(supervisor.owner))
+            supervisor.send_keys(session_id, rng.choice(letters) + '\b')
+        previous = now
+
+        # keep the room full
+        for _ in range(sessions - len(supervisor.owner)):
+            supervisor.create_session(Levels.hard, seed=rng.randrange(2**32))
+        supervisor.rebalance()
+
+    stats = supervisor.stats()
+    supervisor.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--keys-per-sec", type=float, default=2, help="per session")
+    parser.add_argument("--skew", action="store_true", help="start every session on worker 0 to exercise rebalancing")
+    args = parser.parse_args()
+
+    stats = load_test(args.workers, args.sessions, args.seconds, args.keys_per_sec, args.skew)
+    print(f"sessions {stats['sessions']} | finished {stats['finished']} | moves {stats['moves']} | worst p99 {stats['worst_p99_ms']} ms")
+    print(f"{'worker':>6} {'sessions':>9} {'load':>6} {'mean ms':>8} {'p99 ms':>8} {'overruns':>9}")
+    for w in stats["workers"]:
+        print(f"{w['worker']:>6} {w['sessions']:>9} {w['load']:>6.2f} {w['tick_mean_ms']:>8.2f} {w['tick_p99_ms']:>8.2f} {w['overruns']:>9}")
+
+
+if __name__ == "__main__":
+    main()
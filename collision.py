@@ -0,0 +1,53 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from components import EntityStore
+
+
+def find_collisions(words: EntityStore, bullets: EntityStore) -> List[Tuple[int, int]]:
+    '''
+    pairs every bullet with at most one word it overlaps, returned as (word_slot, bullet_slot).
+    entities only move horizontally, so they are bucketed by line and each line
+    is resolved as a sweep over x intervals sorted with np.lexsort/np.searchsorted
+    '''
+    bullet_slots = bullets.slots
+    word_slots = words.slots
+    if len(bullet_slots) == 0 or len(word_slots) == 0:
+        return []
+
+    # bucket by line, sorted by left edge inside each line
+    word_slots = word_slots[np.lexsort((words.x[word_slots], words.line[word_slots]))]
+    word_lines = words.line[word_slots]
+    word_left = words.x[word_slots]
+    word_right = word_left + words.width[word_slots]
+
+    bullet_slots = bullet_slots[np.lexsort((bullets.x[bullet_slots], bullets.line[bullet_slots]))]
+    bullet_lines = bullets.line[bullet_slots]
+    bullet_left = bullets.x[bullet_slots]
+    bullet_right = bullet_left + bullets.width[bullet_slots]
+
+    pairs = []
+    for line in np.unique(bullet_lines).tolist():
+        w_lo, w_hi = np.searchsorted(word_lines, [line, line + 1]).tolist()
+        if w_lo == w_hi:
+            continue
+        b_lo, b_hi = np.searchsorted(bullet_lines, [line, line + 1]).tolist()
+
+        left = word_left[w_lo:w_hi]
+        right = word_right[w_lo:w_hi]
+        max_width = (right - left).max()
+
+        # a word can only overlap a bullet when its left edge lies in (bullet_left - max_width, bullet_right)
+        ends = np.searchsorted(left, bullet_right[b_lo:b_hi], side="left").tolist()
+        starts = np.searchsorted(left, bullet_left[b_lo:b_hi] - max_width, side="right").tolist()
+
+        is_hit = [False]*(w_hi - w_lo)
+        for b, start, end in zip(range(b_lo, b_hi), starts, ends):
+            for w in range(end - 1, start - 1, -1):
+                if not is_hit[w] and right[w] > bullet_left[b]:
+                    is_hit[w] = True
+                    pairs.append((int(word_slots[w_lo + w]), int(bullet_slots[b])))
+                    break
+
+    return pairs
@@ -1,36 +1,356 @@
-from time import time
-from typing import Tuple
-
 import numpy as np
 
-from items import RunningWord, Word, Tower
 from utils import (
     get_word,
+    get_word_id,
+    get_word_score,
+    PygameFunction,
     Queue,
     InfoTable,
 )
 
-_STD_LINE_GAP = 40
+# collision widths are game rules rather than view state, so a recorded session
+# replays the same headless as drawn. they match the shipped fonts: word.ttf at
+# 20 px advances 12 px for every char of any script, the bullet is "@" in sym.ttf at 30 px
+_CHAR_WIDTH = 12   # px
+_BULLET_WIDTH = 24  # px
+
+
+def text_width(text: str):
+    return len(text)*_CHAR_WIDTH
+
+
+# Entities, rows of an EntityStore stepped by the simulation and drawn by items.py
+
+class EntityStore:
+    '''
+    struct-of-arrays storage, one row (slot) per entity and a free list of reusable slots,
+    so movement and per-frame checks run as one vectorized operation over all entities
+    '''
+    _INIT_CAPACITY = 64
+    _COLUMNS = {
+        "alive": bool,
+        "x": np.float64,
+        "prev_x": np.float64,
+        "speed": np.float64,  # px/sec, signed
+        "line": np.int16,
+        "width": np.int32,
+        "score": np.int16,
+        "color": np.int8,
+        "word_id": np.int32,  # index into the vocabulary, -1 for non-word entities
+        "owner": np.int32,    # index of the firing tower, -1 for non-bullet entities
+        "highlighted": bool,
+    }
+
+    def __init__(self, capacity: int=_INIT_CAPACITY):
+        for name, dtype in self._COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return self.capacity - len(self._free)
 
+    @property
+    def capacity(self):
+        return len(self.alive)
 
-class WordRunningLine:
-    ID = 1
+    @property
+    def slots(self):
+        return np.flatnonzero(self.alive)
+
+    def _grow(self):
+        capacity = self.capacity
+        for name, dtype in self._COLUMNS.items():
+            column = np.zeros(capacity*2, dtype=dtype)
+            column[:capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self._free.extend(range(capacity*2 - 1, capacity - 1, -1))
+
+    def alloc(self, x: float, speed: float, line: int, width: int, score: int=0, word_id: int=-1, owner: int=-1):
+        if not self._free:
+            self._grow()
+
+        slot = self._free.pop()
+        self.alive[slot] = True
+        self.x[slot] = self.prev_x[slot] = x
+        self.speed[slot] = speed
+        self.line[slot] = line
+        self.width[slot] = width
+        self.score[slot] = score
+        self.color[slot] = 0
+        self.word_id[slot] = word_id
+        self.owner[slot] = owner
+        self.highlighted[slot] = False
+        return slot
+
+    def free(self, slot: int):
+        if not self.alive[slot]:
+            return  # a slot listed twice would be handed to two entities
+        self.alive[slot] = False
+        self._free.append(slot)
+
+    def step(self, dt: float, *, is_pause: bool=False):
+        np.copyto(self.prev_x, self.x)
+
+        # dead rows move too, they are reset on alloc and that is cheaper than masking
+        if not is_pause:
+            self.x += self.speed*dt
 
-    def __init__(self, pos: Tuple[int, int], line_boundry: int):
-        self.pos = pos
-        self.word_queue = Queue()
-        self.tower = None
+    def clear(self):
+        self.alive[:] = False
+        self._free = list(range(self.capacity - 1, -1, -1))
+
+class RunningWord:
+    '''
+    rules of the running words, the words themselves are rows of the board's EntityStore
+    '''
+    SAFE = 0
+    WARNING = 1
+    DENGEOUS = 2
+
+    _COLOR_BOUNDRIES = np.array([500, 800])  # safe | warning | dengeous
+
+    @classmethod
+    def classify(cls, x: np.ndarray):
+        return np.digitize(x, cls._COLOR_BOUNDRIES, right=True).astype(np.int8)
+
+class Bullet:
+    _SPEED = 90  # px/sec
+
+class Tower:
+    _GUARDING_LINE_POS = 950  # screen width: 1000
+    _COOL_TIME = 1
+    _LIFE_CYCLE = 20
+
+    def __init__(self, idx: int, line: int, now: float, bullet_width: int):
+        self.idx = idx
+        self.line = line
+        self.x = self._GUARDING_LINE_POS
+        self.bullet_width = bullet_width
+        self.bullet_queue = Queue()  # slots of the TowerManager's bullet store
+        self.create_time = self.previous_fire_time = now
 
-        self._LINE_BOUNDRY = line_boundry
+    @property
+    def first_bullet(self):
+        return self.bullet_queue.head
+
+    def is_expired(self, now: float):
+        return now - self.create_time > self._LIFE_CYCLE
+
+    def can_fire(self, now: float):
+        return (
+            not self.is_expired(now) and
+            now - self.previous_fire_time > self._COOL_TIME
+        )
+
+    def fire(self, now: float, bullets: EntityStore):
+        self.bullet_queue.append(bullets.alloc(self.x, -Bullet._SPEED, self.line, self.bullet_width, owner=self.idx))
+        self.previous_fire_time = now
+
+class InputBuffer:
+    COMMAND_PREFIX = '/'
+
+    TYPING_MODE = 0
+    COMMAND_MODE = 1
+
+    _INPUT_LEN_MAX = 16
+
+    def __init__(self):
+        self.inputbox = ""
+        '''
+        typing: (default)
+        command: "/" prefix
+        '''
+        self.mode = InputBuffer.TYPING_MODE
+
+    def is_empty(self):
+        return len(self.inputbox) == 0
+
+    def is_full(self):
+        return len(self.inputbox) >= self._INPUT_LEN_MAX
+
+    def is_typing(self):
+        return self.mode == InputBuffer.TYPING_MODE
+
+    def is_valid(self, key: str):
+        if self.mode == InputBuffer.COMMAND_MODE:
+            return True
+
+        if key == InputBuffer.COMMAND_PREFIX:
+            return True
+
+        # any script, and the punctuation of words like "Ph.D."
+        return len(key) == 1 and key.isprintable() and not key.isspace()
+
+    def read(self, key: str):
+        if key == PygameFunction.KEY_BACKSPACE:
+            self.inputbox = self.inputbox[:-1]
+            return
+
+        if key == InputBuffer.COMMAND_PREFIX and self.mode == InputBuffer.COMMAND_MODE:
+            self.mode = InputBuffer.TYPING_MODE
+        elif key is not None:
+            if self.is_empty() and key == InputBuffer.COMMAND_PREFIX:
+                self.mode = InputBuffer.COMMAND_MODE
+            elif not self.is_full() and self.is_valid(key):
+                self.inputbox += key
+
+    def clear(self):
+        self.inputbox = ""
+
+
+# Components
+
+class _TrieNode:
+    __slots__ = ("children", "words")
+
+    def __init__(self):
+        self.children = {}
+        self.words = set()  # slots of every live word below this prefix
+
+class WordTrie:
+    '''
+    prefix trie over the live words, with a cursor that follows the user input one key at a time
+    '''
+    def __init__(self):
+        self.clear()
+
+    @property
+    def prefix(self):
+        return self._prefix
+
+    @property
+    def candidates(self):
+        node = self._path[-1]
+        return () if node is None else node.words
+
+    def insert(self, slot: int, text: str):
+        node = self._root
+        node.words.add(slot)
+        for char in text:
+            node = node.children.setdefault(char, _TrieNode())
+            node.words.add(slot)
+
+        # the new word may have created nodes the cursor was waiting for
+        if self._path[-1] is None:
+            self._rewalk()
+
+    def remove(self, slot: int, text: str):
+        # emptied nodes are kept, the trie is bounded by the vocabulary
+        node = self._root
+        node.words.discard(slot)
+        for char in text:
+            node = node.children.get(char)
+            if node is None:
+                return
+            node.words.discard(slot)
+
+    def push(self, char: str):
+        node = self._path[-1]
+        self._path.append(None if node is None else node.children.get(char))
+        self._prefix += char
+
+    def pop(self):
+        if len(self._path) > 1:
+            self._path.pop()
+            self._prefix = self._prefix[:-1]
+
+    def follow(self, text: str):
+        # back up to the common prefix then advance, one step per typed or erased key
+        common = 0
+        for a, b in zip(self._prefix, text):
+            if a != b:
+                break
+            common += 1
+
+        while len(self._prefix) > common:
+            self.pop()
+        for char in text[common:]:
+            self.push(char)
+
+    def _rewalk(self):
+        prefix = self._prefix
+        self._prefix = ""
+        self._path = [self._root]
+        for char in prefix:
+            self.push(char)
+
+    def clear(self):
+        self._root = _TrieNode()
+        self._prefix = ""
+        self._path = [self._root]
+
+class WordIndex:
+    '''
+    hash index of the live words on a board: text -> [(line, slot), ...] in spawn order,
+    plus a prefix trie used to highlight the candidates of the current input
+    '''
+    def __init__(self, words: EntityStore):
+        self.words = words
+        self._table = {}
+        self._texts = {}  # slot -> text
+        self.trie = WordTrie()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def text(self, slot: int):
+        return self._texts[slot]
+
+    def add(self, line: "WordRunningLine", slot: int, text: str):
+        self._table.setdefault(text, []).append((line, slot))
+        self._texts[slot] = text
+        self.trie.insert(slot, text)
+
+        prefix = self.trie.prefix
+        self.words.highlighted[slot] = bool(prefix) and text.startswith(prefix)
+
+    def discard(self, slot: int):
+        text = self._texts.pop(slot, None)
+        if text is None:
+            return
+
+        entries = self._table[text]
+        for i, (_, indexed_slot) in enumerate(entries):
+            if indexed_slot == slot:
+                del entries[i]
+                break
+
+        if not entries:
+            del self._table[text]
+        self.trie.remove(slot, text)
+
+    def lookup(self, text: str):
+        return self._table.get(text, ())
+
+    def follow(self, prefix: str):
+        if prefix == self.trie.prefix:
+            return
+
+        self.words.highlighted[list(self.trie.candidates)] = False
+
+        self.trie.follow(prefix)
+
+        if prefix:
+            self.words.highlighted[list(self.trie.candidates)] = True
+
+    def clear(self):
+        self._table.clear()
+        self._texts.clear()
+        self.trie.clear()
+
+class WordRunningLine:
+    def __init__(self, idx: int, words: EntityStore, word_index: WordIndex):
+        self.idx = idx
+        self.words = words
+        self.word_queue = Queue()  # slots of the board's word store, in spawn order
+        self.tower = None
+        self.word_index = word_index
 
         self._is_match = False
         self.match_word_score = None
         self.oob_word_score = None
         self.char_num = 0
-
-        xpos, ypos = self.pos
-        self.line_id = Word(f"{self.ID:3d}", (self._LINE_BOUNDRY - 50, ypos))
-        WordRunningLine.ID += 1
     
     @property
     def word_num(self):
@@ -46,72 +366,56 @@ class WordRunningLine:
         self._is_match = False  # reset
         return match_flag
     
-    def have_tower(self):
+    def have_tower(self, now: float):
         return (
             self.tower is not None and
-            not self.tower.is_expired()
+            not self.tower.is_expired(now)
         )
-    
-    def get_oob_word(self):
-        if self.first_word is None:
-            return None
-
-        x, y = self.first_word.pos
-        is_oob = x > self._LINE_BOUNDRY
 
-        if not is_oob:
-            return None
-
-        return self.word_queue.pop(0)
-
-    def add_word(self, text: str):
-        self.word_queue.append(RunningWord(text, self.pos))
+    def add_word(self, word_id: int, text: str, width: int, speed: float, x: float=0):
+        slot = self.words.alloc(x, speed, self.idx, width, get_word_score(word_id), word_id)
+        self.word_queue.append(slot)
+        self.word_index.add(self, slot, text)
+        return slot
     
-    def check_match(self, input_word: str):
-        if input_word not in self.word_queue:
-            return
-
-        self._is_match = True
-        idx = self.word_queue.index(input_word)
-        self.match_word_score = self.word_queue[idx].score
-        self.word_queue.remove(input_word)
-        self.char_num += len(input_word)
+    def remove_word(self, slot: int):
+        self.word_queue.remove_item(slot)
+        self.word_index.discard(slot)
+        self.words.free(slot)
     
-    def update(self, input_word: str, *, is_pause: bool=False):
-        self.match_word_score = 0
-        self.oob_word_score = 0
-
-        self.check_match(input_word) 
-        
-        oob_word = self.get_oob_word()
-        if oob_word is not None:
-            self.oob_word_score = oob_word.score
-
-        for word in self.word_queue:
-            word.update(is_pause=is_pause)
-
-        if not self.have_tower():
-            self.line_id.update()
-            self.tower = None
+    def match(self, slot: int):
+        self._is_match = True
+        self.match_word_score = int(self.words.score[slot])
+        self.char_num += len(self.word_index.text(slot))
+        self.remove_word(slot)
     
     def clear(self):
+        # the board resets the shared store and index once for all lines
         self.word_queue.clear()
         self.char_num = 0
         self.tower = None
 
 class WordRunningBoard:
-    _LINE_GAP = _STD_LINE_GAP
-
     _GENERATE_CYCLE = 2  # sec/word
+    _RUNNING_SPEED = 60  # px/sec
 
-    def __init__(self, line_num: int, pos: Tuple[int, int], line_boundry: int):
-        x, y = pos
-        self.lines = [WordRunningLine((x, y + i*self._LINE_GAP), line_boundry) for i in range(line_num)]
+    def __init__(self, line_num: int, line_boundry: int):
+        self.words = EntityStore()
+        self.word_index = WordIndex(self.words)
+        self.lines = [WordRunningLine(i, self.words, self.word_index) for i in range(line_num)]
         self.total_match_word_score = None
         self.total_oob_word_score = None
         self.total_char_num = 0
 
-        self.prev_generate_time = time()
+        self._LINE_BOUNDRY = line_boundry
+
+        # per board, so boards of different levels can run side by side
+        self.generate_cycle = self._GENERATE_CYCLE
+        self.speed = self._RUNNING_SPEED
+
+        self.prev_generate_time = 0.0
+        self.rng = np.random.default_rng()  # seeded by the engine for reproducible sessions
+        self.level = None  # Levels value, picks the word tiers to spawn
 
         self.generate_record = [-1]*3  # only record recent 3 line's idx, used to avoiding word overlapping
     
@@ -122,13 +426,16 @@ class WordRunningBoard:
     @property
     def is_match(self):
         return any(line.is_match for line in self.lines)
+
+    def word_text(self, slot: int):
+        return self.word_index.text(slot)
     
-    def can_generate(self):
-        return time() - self.prev_generate_time > self._GENERATE_CYCLE
+    def can_generate(self, now: float):
+        return now - self.prev_generate_time > self.generate_cycle
     
     # handle word overlapping
     def get_random_idx(self):
-        random_idx = np.random.randint(0, len(self.lines))
+        random_idx = int(self.rng.integers(0, len(self.lines)))
 
         if random_idx in self.generate_record:
             random_idx = self.get_random_idx()
@@ -138,62 +445,101 @@ class WordRunningBoard:
         
         return random_idx
 
-    def generate_word(self):
+    def generate_word(self, now: float):
         random_idx = self.get_random_idx()
         selected_line = self.lines[random_idx]
-        generated_word = get_word()
-        selected_line.add_word(generated_word)
+        word_id = get_word_id(self.rng, self.level)
+        generated_word = get_word(word_id)
+        selected_line.add_word(word_id, generated_word, text_width(generated_word), self.speed)
 
-        self.prev_generate_time = time()
+        self.prev_generate_time = now
     
-    def update(self, input_word: str, *, is_pause: bool=False):
-        if self.can_generate() and not is_pause:
-            self.generate_word()
+    def check_match(self, input_word: str):
+        for line in self.lines:
+            line.match_word_score = 0
+
+        # a word typed once clears its first occurrence on every line holding it
+        matched_lines = set()
+        for line, slot in list(self.word_index.lookup(input_word)):
+            if line not in matched_lines:
+                matched_lines.add(line)
+                line.match(slot)
 
-        self.total_match_word_score = 0
-        self.total_oob_word_score = 0
+    def remove_oob_words(self):
         for line in self.lines:
-            line.update(input_word, is_pause=is_pause)
-            self.total_match_word_score += line.match_word_score
-            self.total_oob_word_score += line.oob_word_score
+            line.oob_word_score = 0
+
+        oob_slots = np.flatnonzero(self.words.alive & (self.words.x > self._LINE_BOUNDRY))
+        for slot in oob_slots.tolist():
+            line = self.lines[self.words.line[slot]]
+            line.oob_word_score += int(self.words.score[slot])
+            line.remove_word(slot)
+    
+    def step(self, dt: float, now: float, input_word: str, *, is_pause: bool=False):
+        if self.can_generate(now) and not is_pause:
+            self.generate_word(now)
+
+        self.check_match(input_word)
+        self.remove_oob_words()
+
+        self.words.step(dt, is_pause=is_pause)
+        self.words.color[:] = RunningWord.classify(self.words.x)
+
+        for line in self.lines:
+            if not line.have_tower(now):
+                line.tower = None
+
+        self.total_match_word_score = sum(line.match_word_score for line in self.lines)
+        self.total_oob_word_score = sum(line.oob_word_score for line in self.lines)
         self.total_char_num = sum(line.char_num for line in self.lines)
     
-    def clear(self):
-        self.prev_generate_time = time()
+    def clear(self, now: float=0.0):
+        self.prev_generate_time = now
+        self.generate_record = [-1]*3
+        self.word_index.clear()
+        self.words.clear()
         for line in self.lines:
             line.clear()
 
 class TowerManager:
-    _LINE_GAP = _STD_LINE_GAP
-
     _TOWER_COST = 10
 
     def __init__(self):
         self.towers = []
+        self.bullets = EntityStore()
+        self.bullet_width = _BULLET_WIDTH
     
-    @property
-    def first_bullets(self):
-        return [tower.first_bullet for tower in self.towers]
-    
-    def add_tower(self, ypos: int, info_table: InfoTable):
+    def add_tower(self, ypos: int, info_table: InfoTable, now: float):
         assert ypos >= 0
 
         if info_table.score < self._TOWER_COST:
-            print(f"toewr cost is {self._TOWER_COST}, your score {info_table.score} is too low")
-            return None
+            return None  # the engine reports it as Errors.tower
 
         info_table.score -= self._TOWER_COST
-        ypos = (ypos - 1)*self._LINE_GAP
-        new_tower = Tower(ypos)
+        new_tower = Tower(len(self.towers), ypos - 1, now, self.bullet_width)
         self.towers.append(new_tower)
 
         return new_tower
+
+    def remove_bullet(self, slot: int):
+        tower = self.towers[self.bullets.owner[slot]]
+        tower.bullet_queue.remove_item(slot)
+        self.bullets.free(slot)
         
-    def update(self, *, is_pause: bool=False):
+    def step(self, dt: float, now: float, *, is_pause: bool=False):
+        for tower in self.towers:
+            if tower.can_fire(now) and not is_pause:
+                tower.fire(now, self.bullets)
+
+        self.bullets.step(dt, is_pause=is_pause)
+
+        # bullets of a tower share one speed, so the out of bounds ones are always at the head
         for tower in self.towers:
-            tower.update(is_pause=is_pause)
+            while tower.first_bullet is not None and self.bullets.x[tower.first_bullet] < 0:
+                self.bullets.free(tower.bullet_queue.popleft())
 
     def clear(self):
         for tower in self.towers:
             tower.bullet_queue.clear()
         self.towers.clear()
+        self.bullets.clear()
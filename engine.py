@@ -0,0 +1,191 @@
+import random
+from collections import deque
+from enum import Enum
+
+import numpy as np
+
+from collision import find_collisions
+from commands import (
+    Commands,
+    parse_arg,
+)
+from components import (
+    InputBuffer,
+    WordRunningBoard,
+    TowerManager,
+)
+from utils import (
+    InfoTable,
+    NullProfiler,
+)
+
+
+class Levels(Enum):
+    easy = "easy"
+    medium = "medium"
+    hard = "hard"
+
+class Errors(Enum):
+    unknown_command = "unknown command"
+    param = "invalid parameter"
+    tower = "can't add tower"
+    input_full = "max input length"
+
+class GameEngine:
+    '''
+    headless game state: board, towers, score and user input as plain data,
+    stepped with a fixed dt and drawn by the pygame view in main.py
+    '''
+    _LINE_NUM = 10
+    _LINE_BOUNDRY = 1000  # screen width
+    _MIN_SCORE = -20
+    _MAX_ERRORS = 8  # kept for the view, headless drivers never drain them
+    _level_config_table = {             # (max_score, running_word_speed (px/sec), word_generate_cycle)
+        Levels.easy: (50, 60, 2),
+        Levels.medium: (100, 90, 1.5),
+        Levels.hard: (150, 120, 1.5),
+    }
+
+    def __init__(self, level: Levels=Levels.easy):
+        self.now = 0.0  # simulated seconds
+        self.tick = 0   # steps since reset, keys are recorded against it
+        self.seed = None
+
+        self.board = WordRunningBoard(self._LINE_NUM, self._LINE_BOUNDRY)
+        self.tower_manager = TowerManager()
+        self.input_buffer = InputBuffer()
+        self.info_table = InfoTable(clock=self.game_time)
+
+        self.is_pause = False
+        self.errors = deque(maxlen=self._MAX_ERRORS)  # latest raised since the view last drained them
+        self.profiler = NullProfiler()
+        self.recorder = None  # replay.SessionRecorder
+
+        self.level = None
+        self.max_score = None
+        self.set_level(level)
+
+    def drain_errors(self):
+        errors = list(self.errors)
+        self.errors.clear()
+        return errors
+
+    def game_time(self):
+        # a method rather than a lambda, so engines pickle and can move between processes
+        return self.now
+
+    @property
+    def is_over(self):
+        score = self.info_table.score
+        return (
+            score <= self._MIN_SCORE or
+            score >= self.max_score
+        )
+
+    def set_level(self, level: Levels):
+        self.level = level
+        self.max_score, self.board.speed, self.board.generate_cycle = self._level_config_table[level]
+        self.board.level = level.value
+
+    def reset(self, seed: int=None):
+        # the seed drives every random choice, together with the keys per tick it replays a session
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.board.rng = np.random.default_rng(self.seed)
+
+        self.now = 0.0
+        self.tick = 0
+        self.is_pause = False
+        self.errors.clear()
+
+        self.board.clear(self.now)
+        self.tower_manager.clear()
+        self.input_buffer.clear()
+        self.input_buffer.mode = InputBuffer.TYPING_MODE
+        self.info_table.reset()
+
+    def read_key(self, key: str):
+        if self.recorder is not None:
+            self.recorder.record(self.tick, key)
+
+        self.input_buffer.read(key)
+        if self.input_buffer.is_full():
+            self.errors.append(Errors.input_full)
+        self.is_pause = False
+
+    def command_handler(self, input_str: str):
+        if not input_str or input_str[-1] != '\n':
+            return
+
+        command_str = parse_arg(input_str)
+        if command_str[0] == Commands.pause.value:
+            if len(command_str) > 1:
+                self.errors.append(Errors.param)
+            else:
+                self.is_pause = True
+        elif command_str[0] == Commands.tower.value:
+            if len(command_str) != 2:
+                self.errors.append(Errors.param)
+            else:
+                try:
+                    ypos = int(command_str[1])
+                    if ypos <= 0 or ypos > len(self.board.lines):
+                        self.errors.append(Errors.param)
+                    elif self.board.lines[ypos - 1].tower is not None:
+                        self.errors.append(Errors.tower)
+                    else:
+                        new_toewr = self.tower_manager.add_tower(ypos, self.info_table, self.now)
+                        if new_toewr is None:
+                            self.errors.append(Errors.tower)
+                        else:
+                            self.board.lines[ypos - 1].tower = new_toewr
+                except ValueError:
+                    self.errors.append(Errors.param)
+        else:
+            self.errors.append(Errors.unknown_command)
+        self.input_buffer.mode = InputBuffer.TYPING_MODE
+        self.input_buffer.clear()
+
+    def collision_handler(self):
+        for word_slot, bullet_slot in find_collisions(self.board.words, self.tower_manager.bullets):
+            line = self.board.lines[self.board.words.line[word_slot]]
+            line.remove_word(word_slot)
+            self.tower_manager.remove_bullet(bullet_slot)
+
+    def update_game_info(self):
+        self.info_table.score += self.board.total_match_word_score
+        self.info_table.score -= self.board.total_oob_word_score
+        total_word_num = self.board.total_char_num/5
+
+        try:
+            if not self.is_pause:
+                self.info_table.wpm = total_word_num/self.info_table.timer*60
+        except ZeroDivisionError:
+            self.info_table.wpm = 0.0
+
+        self.info_table.checkpoint()
+
+    def step(self, dt: float):
+        self.tick += 1
+        if not self.is_pause:
+            # game time stands still while paused, so no timer needs shifting afterwards
+            self.now += dt
+
+        user_input = self.input_buffer.inputbox
+        self.board.word_index.follow(user_input if self.input_buffer.is_typing() else "")
+
+        self.board.step(dt, self.now, user_input, is_pause=self.is_pause)
+        self.profiler.mark("board")
+        self.tower_manager.step(dt, self.now, is_pause=self.is_pause)
+        self.profiler.mark("towers")
+
+        if self.board.is_match:
+            self.input_buffer.clear()
+
+        if self.input_buffer.mode == InputBuffer.COMMAND_MODE:
+            self.command_handler(self.input_buffer.inputbox)
+        self.collision_handler()
+        self.profiler.mark("collision")
+        self.update_game_info()
+        self.profiler.mark("info")
+
+        return self.is_over
@@ -1,15 +1,27 @@
-import re
-from time import time
-from typing import Tuple, Union
-
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Mapping, Tuple, Union
+
+import numpy as np
 import pygame
 
+from components import (
+    InputBuffer,
+    RunningWord,
+    TowerManager,
+    WordRunningBoard,
+)
+from engine import Errors
 from utils import (
     Colors,
     Fonts,
-    PygameFunction,
-    Queue,
+    FontRegistry,
+    FrameProfiler,
     InfoTable,
+    TextCache,
 )
 
 
@@ -17,6 +29,7 @@ from utils import (
 
 class Item(pygame.sprite.Sprite):
     _DISPLAY_SURF = None
+    _DIRTY_RECTS = []  # screen regions touched since the last flush
 
     def __init__(self):
         super().__init__()
@@ -30,9 +43,19 @@ class Item(pygame.sprite.Sprite):
     def pos(self):
         raise NotImplementedError
     
+    @classmethod
+    def track(cls, rec):
+        Item._DIRTY_RECTS.append(pygame.Rect(rec))
+
+    @classmethod
+    def flush_dirty_rects(cls):
+        rects = Item._DIRTY_RECTS
+        Item._DIRTY_RECTS = []
+        return rects
+
     def build(self, obj, rec):
         assert self._DISPLAY_SURF is not None, "Error: please setting display serface before build item."
-        self._DISPLAY_SURF.blit(obj, rec)
+        self.track(self._DISPLAY_SURF.blit(obj, rec))
 
 class Word(Item):
     _FONT_STYLE = Fonts.std_font.value
@@ -45,9 +68,11 @@ class Word(Item):
         if font_style is None:
             font_style = self._FONT_STYLE
 
-        self.font = pygame.font.Font(font_style, self._FONT_SIZE) 
+        self.font = FontRegistry.get(font_style, self._FONT_SIZE)
         self.font_color = self._FONT_COLOR if color is None else color
         self.text = text
+        self.background = None
+        self._rendered = None  # (text, color, background) of the current surface
         self._create_word(pos)
     
     def __eq__(self, __value: str):
@@ -58,8 +83,12 @@ class Word(Item):
         return self.word_rec.topleft
     
     def _set_pos(self, xy: Tuple[int, int]):
-        self.word = self.font.render(self.text, True, self.font_color) 
-        self.word_rec = self.word.get_rect()
+        # only re-render when the text or color changed, otherwise just move the rect
+        rendered = (self.text, self.font_color, self.background)
+        if self._rendered != rendered:
+            self.word = TextCache.render(self.font, self.text, True, self.font_color, self.background)
+            self.word_rec = self.word.get_rect()
+            self._rendered = rendered
         self.word_rec.topleft = xy
     
     def _create_word(self, pos: Tuple[int, int]):
@@ -71,161 +100,117 @@ class Word(Item):
             new_pos = self.pos
         self._create_word(new_pos)
 
-class RunningWord(Word):
+class BoardView(Item):
     _FONT_STYLE = Fonts.running_word_font.value
-    _SAFE_COLOR = Colors.GREEN.value
-    _WARNING_COLOR = Colors.YELLOW.value
-    _DENGEOUS_COLOR = Colors.RED.value
-    _SAFE_BOUNDRY = 500
-    _WARNING_BOUNDRY = 800
-
-    '''
-    1. (5, 12)
-        easy:       [2, 4]       11.70%
-        medium:     [5, 11]      84.80%
-        hard:       [12, 16]      4.40%
-    2. (7, 10) - more reasonable
-        easy:       [2, 6]       39.97%
-        medium:     [7, 9]       42.23%
-        hard:       [10, 16]     18.70%
-    '''
-
-    _EASY_THRESHOLD = 7
-    _HARD_THRESHOLD = 10
-    _RUNNING_SPEED = 2
-
-    def __init__(self, text: str, pos: Tuple[int, int], *args):
-        super().__init__(text, pos, self._SAFE_COLOR, *args)
-
-        self.score = self.get_score()
-    
-    @property
-    def body(self):
-        return self.word_rec
-    
-    def _color_update(self, x: int):
-        if x > self._WARNING_BOUNDRY:
-            self.font_color = self._DENGEOUS_COLOR
-        elif x > self._SAFE_BOUNDRY:
-            self.font_color = self._WARNING_COLOR
-    
-    def get_score(self):
-        word_len = len(self.text)
-
-        if word_len < self._EASY_THRESHOLD:
-            return 3
-        elif word_len < self._HARD_THRESHOLD:
-            return 5
-        else:
-            return 10
+    _FONT_SIZE = 20
+    _LINE_GAP = 40
+    _WORD_COLORS = {
+        RunningWord.SAFE: Colors.GREEN.value,
+        RunningWord.WARNING: Colors.YELLOW.value,
+        RunningWord.DENGEOUS: Colors.RED.value,
+    }
+    _HIGHLIGHT_COLOR = Colors.DARK_GRAY.value
+
+    def __init__(self, board: WordRunningBoard, pos: Tuple[int, int], line_boundry: int):
+        super().__init__()
 
-    def update(self, *, is_pause: bool=False):
-        x, y = self.pos
+        self.board = board
+        self.font = FontRegistry.get(self._FONT_STYLE, self._FONT_SIZE)
 
-        if not is_pause:
-            x += self._RUNNING_SPEED
+        xpos, ypos = pos
+        self.line_ypos = [ypos + i*self._LINE_GAP for i in range(len(board.lines))]
+        self.line_ids = [
+            Word(f"{i + 1:3d}", (line_boundry - 50, line_ypos))
+            for i, line_ypos in enumerate(self.line_ypos)
+        ]
 
-        new_pos = (x, y)
-        self._color_update(x)
-        super().update(new_pos)
+    def update(self, alpha: float=1.0):
+        words = self.board.words
+        slots = words.slots
+
+        # alpha interpolates between the last two simulated positions
+        xs = np.rint(words.prev_x[slots] + (words.x[slots] - words.prev_x[slots])*alpha).astype(int)
+        for slot, x, line, color, highlighted in zip(
+            slots.tolist(),
+            xs.tolist(),
+            words.line[slots].tolist(),
+            words.color[slots].tolist(),
+            words.highlighted[slots].tolist(),
+        ):
+            background = self._HIGHLIGHT_COLOR if highlighted else None
+            surface = TextCache.render(self.font, self.board.word_text(slot), True, self._WORD_COLORS[color], background)
+            self.build(surface, (x, self.line_ypos[line]))
+
+        for line, line_id in zip(self.board.lines, self.line_ids):
+            if line.tower is None:
+                line_id.update()
 
 class UserInputDisplay(Word):
-    _COMMAND_PREFIX = '/'
-
-    _TYPING_MODE = 0
-    _COMMAND_MODE = 1
-
-    _INPUT_LEN_MAX = 16
-
     def __init__(self, pos: Tuple[int, int], *args):
         super().__init__("", pos, *args)
 
-        self.inputbox = ""
-        '''
-        typing: (default)
-        command: "/" prefix
-        '''
-        self.mode = UserInputDisplay._TYPING_MODE
-    
-    @property
-    def mode(self):
-        return self._mode
-    
-    @mode.setter
-    def mode(self, new_mode: int):
-        self._mode = new_mode
-        self.update_text()
-    
-    def is_empty(self):
-        return len(self.inputbox) == 0
-    
-    def is_full(self):
-        return len(self.inputbox) >= self._INPUT_LEN_MAX
-    
-    def is_valid(self, key: str):
-        if self.mode == UserInputDisplay._COMMAND_MODE:
-            return True
-    
-        if key == UserInputDisplay._COMMAND_PREFIX:
-            return True
+    def update(self, input_buffer: InputBuffer):
+        mode_name = "typing" if input_buffer.is_typing() else "command"
+        mode_str = f"[ {mode_name} ] "
+        input_str = f"\"{input_buffer.inputbox}\""
+        self.text = mode_str + input_str
 
-        pattern = r'^[a-zA-Z]+$'
-        return bool(re.match(pattern, key))
-    
-    def _add_key(self, key: str):
-        assert isinstance(key, str)
-        self.inputbox += key
-        self.update_text()
-    
-    def _pop(self):
-        self.inputbox = self.inputbox[:-1]
-        self.update_text()
-    
-    def read(self, key: str):
-        if key == PygameFunction.KEY_BACKSPACE:
-            self._pop()
-            return
+        super().update()
 
-        if key == UserInputDisplay._COMMAND_PREFIX and self.mode == UserInputDisplay._COMMAND_MODE:
-            self.mode = UserInputDisplay._TYPING_MODE
-        elif key is not None:
-            if self.is_empty() and key == UserInputDisplay._COMMAND_PREFIX:
-                self.mode = UserInputDisplay._COMMAND_MODE
-            elif not self.is_full() and self.is_valid(key):
-                self._add_key(key)
+class GameInfo(Item):
+    '''
+    one cached surface per InfoTable field, a field is only re-formatted and
+    re-rendered when its value changed and its refresh interval has passed
+    '''
+    _FONT_STYLE = Fonts.std_font.value
+    _FONT_SIZE = 20
+    _FONT_COLOR = Colors.WHITE.value
+    _SEPARATOR = " | "
+    _REFRESH_INTERVALS = {  # sec, fields not listed refresh on every change
+        "wpm": 0.5,
+    }
 
-    def update(self, match: bool):
-        if match:
-            self.clear()
+    def __init__(self, pos: Tuple[int], refresh_intervals: dict=None):
+        super().__init__()
 
-        super().update()
-        
-        return self.inputbox
+        self._pos = pos
+        self.font = FontRegistry.get(self._FONT_STYLE, self._FONT_SIZE)
+        self.refresh_intervals = dict(self._REFRESH_INTERVALS if refresh_intervals is None else refresh_intervals)
+        self.separator = TextCache.render(self.font, self._SEPARATOR, True, self._FONT_COLOR)
+        self.segments = {}  # field -> [value, refresh_time, surface]
 
-    def update_text(self):
-        mode_name = "typing" if self.mode == UserInputDisplay._TYPING_MODE else "command"
-        mode_str = f"[ {mode_name} ] "
-        input_str = f"\"{self.inputbox}\""
-        self.text = mode_str + input_str
-    
-    def clear(self):
-        self.inputbox = ""
-        self.update_text()
+    @property
+    def pos(self):
+        return self._pos
 
-class GameInfo(Word):
-    def __init__(self, pos: Tuple[int], *args):
-        super().__init__("", pos, *args)
-    
     @classmethod
     def info_format(cls, k: str, v: Union[int, float]):
         if isinstance(v, float):
             return f"{k}: {v:.2f}"
         return f"{k}: {v}"
-    
-    def update(self, info_table: InfoTable):
-        info_table_ = {k: v for k, v in info_table.__dict__.items() if k[0] != '_'}
-        self.text = " | ".join(GameInfo.info_format(k, v) for k, v in info_table_.items())
-        super().update()
+
+    def _refresh(self, info_table: InfoTable, now: float):
+        for k, v in vars(info_table).items():
+            if k[0] == '_':
+                continue
+            segment = self.segments.get(k)
+            if segment is None:
+                segment = self.segments[k] = [None, None, None]
+            elif segment[0] == v or now - segment[1] < self.refresh_intervals.get(k, 0):
+                continue
+            # values are mostly unique, so they bypass the shared TextCache
+            segment[:] = v, now, self.font.render(self.info_format(k, v), True, self._FONT_COLOR)
+
+    def update(self, info_table: InfoTable, now: float):
+        self._refresh(info_table, now)
+
+        x, y = self.pos
+        for i, (_, _, surface) in enumerate(self.segments.values()):
+            if i:
+                self.build(self.separator, (x, y))
+                x += self.separator.get_width()
+            self.build(surface, (x, y))
+            x += surface.get_width()
 
 class HelpInfo:
     def __init__(self, text: str, pos):
@@ -241,6 +226,122 @@ class HelpInfo:
         for line in self.lines:
             line.update()
 
+class ProfilerOverlay:
+    _REFRESH_INTERVAL = 0.5  # sec
+    _PADDING = 22
+
+    def __init__(self, pos: Tuple[int, int]):
+        self.pos = pos
+        self.lines = []
+        self._refresh_time = 0.0
+
+    def _set_text(self, textline):
+        xpos, ypos = self.pos
+        while len(self.lines) < len(textline):
+            self.lines.append(Word("", (xpos, ypos + len(self.lines)*self._PADDING), Colors.GRAY.value))
+        for line, text in zip(self.lines, textline):
+            line.text = text
+        for line in self.lines[len(textline):]:
+            line.text = ""
+
+    def update(self, profiler: FrameProfiler, now: float):
+        # text is only re-formatted a few times per second, the lines are drawn every frame
+        if now - self._refresh_time > self._REFRESH_INTERVAL:
+            self._refresh_time = now
+            textline = [f"fps {profiler.fps:6.1f}"]
+            textline += [f"{stage:<9} {ms:6.2f} ms" for stage, ms in profiler.averages().items()]
+            self._set_text(textline)
+
+        for line in self.lines:
+            line.update()
+
+class HistoryChart(Item):
+    '''
+    performance chart plotted by visualizer.py in a child process, the game keeps
+    drawing frames while it runs and only loads the finished png
+    '''
+    _FONT_STYLE = Fonts.std_font.value
+    _FONT_SIZE = 30
+    _FONT_COLOR = Colors.WHITE.value
+    _BACKGROUND_COLOR = Colors.BLACK.value
+    _VISUALIZER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "visualizer.py")
+
+    def __init__(self, size: Tuple[int, int]):
+        super().__init__()
+
+        self.size = size
+        self.font = FontRegistry.get(self._FONT_STYLE, self._FONT_SIZE)
+        self.visible = False
+        self.image = None
+        self.status = ""
+        self._process = None
+        self._path = None
+        self._stderr = None
+
+    @property
+    def pos(self):
+        return (0, 0)
+
+    def open(self, history: Mapping, play_time: float, sessions_path: str=None):
+        self.visible = True
+        if self.image is not None or self._process is not None:
+            return
+
+        fd, self._path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        # a file, not a pipe: a child warning more than a pipe buffer would block on it
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            [sys.executable, self._VISUALIZER, self._path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self._stderr,
+        )
+        request = {"history": history, "play_time": play_time, "size": self.size, "sessions": sessions_path}
+        self._process.stdin.write(json.dumps(request).encode("utf-8"))
+        self._process.stdin.close()
+        self.status = "plotting ..."
+
+    def close(self):
+        self.visible = False
+
+    def _poll(self):
+        if self._process is None or self._process.poll() is None:
+            return
+
+        self._stderr.seek(0)
+        error = self._stderr.read().decode("utf-8", "replace").strip()
+        if self._process.returncode == 0:
+            image = pygame.image.load(self._path)
+            if image.get_size() != tuple(self.size):
+                image = pygame.transform.smoothscale(image, self.size)
+            self.image = image.convert()
+        else:
+            self.status = f"plot failed: {error.splitlines()[-1] if error else self._process.returncode}"
+        self._stderr.close()
+        self._process = self._stderr = None
+        os.remove(self._path)
+
+    def update(self):
+        self._poll()
+        self.track(self._DISPLAY_SURF.fill(self._BACKGROUND_COLOR))
+        if self.image is not None:
+            self.build(self.image, (0, 0))
+        else:
+            text = TextCache.render(self.font, self.status, True, self._FONT_COLOR)
+            self.build(text, text.get_rect(center=self._DISPLAY_SURF.get_rect().center))
+
+    def cancel(self):
+        # the chart belongs to one game, a plot still running is dropped with it
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._stderr.close()
+            self._process = self._stderr = None
+            os.remove(self._path)
+        self.image = None
+        self.visible = False
+
 class ErrorMessage(Word):
     _FONT_STYLE = Fonts.sym_font.value
     _DISPLAING_TIME = 5
@@ -250,24 +351,12 @@ class ErrorMessage(Word):
 
         self.error_occur_time = None
     
-    def unknown_command_error(self):
-        self.text = "unknown command"
-        self.error_occur_time = time()
+    def show(self, error: Errors, now: float):
+        self.text = error.value
+        self.error_occur_time = now
     
-    def param_error(self):
-        self.text = "invalid parameter"
-        self.error_occur_time = time()
-    
-    def tower_error(self):
-        self.text = "can't add tower"
-        self.error_occur_time = time()
-    
-    def input_full_warning(self):
-        self.text = "max input length"
-        self.error_occur_time = time()
-    
-    def update(self):
-        if self.error_occur_time and time() - self.error_occur_time > self._DISPLAING_TIME:
+    def update(self, now: float):
+        if self.error_occur_time is not None and now - self.error_occur_time > self._DISPLAING_TIME:
             self.text = ""
 
         super().update()
@@ -276,90 +365,38 @@ class ErrorMessage(Word):
         self.text = ""
         self.error_occur_time = None
 
-class Tower(Word):
-    _GUARDING_LINE_POS = 950  # screen width: 1000
+class TowerView(Item):
+    _TOWER_SYMBOL = "-=("
+    _BULLET_SYMBOL = '@'
     _PADDING = 7
-    _SYMBOL = "-=("
-    _COOL_TIME = 1
-    _LIFE_CYCLE = 20
+    _LINE_GAP = 40
 
     _FONT_STYLE = Fonts.sym_font.value
     _FONT_SIZE = 30
     _TOWER_COLOR = Colors.PURPLE.value
 
-    def __init__(self, ypos):
-        super().__init__(
-            text=self._SYMBOL,
-            pos=(self._GUARDING_LINE_POS, ypos + self._PADDING),
-            color=self._TOWER_COLOR
-        )
-
-        self.bullet_queue = Queue()
-        self.create_time = self.previous_fire_time = time()
-    
-    @property
-    def first_bullet(self):
-        return self.bullet_queue.head
-    
-    def is_expired(self):
-        return time() - self.create_time > self._LIFE_CYCLE
-    
-    def can_fire(self):
-        return (
-            not self.is_expired() and
-            time() - self.previous_fire_time > self._COOL_TIME
-        )
-    
-    def fire(self):
-        self.bullet_queue.append(Bullet(self.pos))
-        self.previous_fire_time = time()
-    
-    def update(self, *, is_pause: bool=False):
-        if not self.is_expired():
-            super().update()
-
-        if self.can_fire() and not is_pause:
-            self.fire()
-
-        bullet_queue_copy = list(self.bullet_queue)
-        for bullet in bullet_queue_copy:
-            bullet.update(is_pause=is_pause)
-            if bullet.is_oob():
-                self.bullet_queue.pop(0)
+    def __init__(self, tower_manager: TowerManager):
+        super().__init__()
 
-class Bullet(Word):
-    _GUARDING_LINE_POS = 980  # screen width: 1000
-    _PADDING = 10
-    _SYMBOL = '@'
-    _SPEED = 3
+        self.tower_manager = tower_manager
+        self.font = FontRegistry.get(self._FONT_STYLE, self._FONT_SIZE)
 
-    _FONT_STYLE = Fonts.sym_font.value
-    _FONT_SIZE = 30
-    _BULLET_COLOR = Colors.PURPLE.value
+    def update(self, now: float, alpha: float=1.0):
+        tower_surface = TextCache.render(self.font, self._TOWER_SYMBOL, True, self._TOWER_COLOR)
+        bullet_surface = TextCache.render(self.font, self._BULLET_SYMBOL, True, self._TOWER_COLOR)
 
-    def __init__(self, pos):
-        super().__init__(
-            text=self._SYMBOL,
-            pos=pos,
-            color=self._BULLET_COLOR
-        )
-    
-    @property
-    def body(self):
-        return self.word_rec
-    
-    def is_oob(self):
-        xpos, ypos = self.pos
-        return xpos < 0
-    
-    def update(self, *, is_pause: bool=False):
-        xpos, ypos = self.pos
+        for tower in self.tower_manager.towers:
+            if not tower.is_expired(now):
+                self.build(tower_surface, (tower.x, self._line_ypos(tower.line)))
 
-        if not is_pause:
-            xpos -= self._SPEED
+        bullets = self.tower_manager.bullets
+        slots = bullets.slots
+        xs = np.rint(bullets.prev_x[slots] + (bullets.x[slots] - bullets.prev_x[slots])*alpha).astype(int)
+        for x, line in zip(xs.tolist(), bullets.line[slots].tolist()):
+            self.build(bullet_surface, (x, self._line_ypos(line)))
 
-        new_pos = (xpos, ypos)
-        super().update(new_pos)
+    def _line_ypos(self, line: int):
+        return line*self._LINE_GAP + self._PADDING
 
 # Widget
 
@@ -374,7 +411,7 @@ class Button(Item):
         x -= self.WIDTH/2
         y -= self.HEIGHT/2
         self.rect = pygame.Rect(x, y, self.WIDTH, self.HEIGHT)
-        self.font = pygame.font.Font(self._FONT_STYLE, self._FONT_SIZE)
+        self.font = FontRegistry.get(self._FONT_STYLE, self._FONT_SIZE)
         self.text = text
         self.text_color = text_color
         self.button_color = button_color
@@ -386,10 +423,10 @@ class Button(Item):
         color = self.hover_color if self.is_hovered else self.button_color
 
         # Draw button
-        pygame.draw.rect(self._DISPLAY_SURF, color, self.rect)
+        self.track(pygame.draw.rect(self._DISPLAY_SURF, color, self.rect))
 
         # Render text
-        text_surface = self.font.render(self.text, True, self.text_color)
+        text_surface = TextCache.render(self.font, self.text, True, self.text_color)
         text_rect = text_surface.get_rect(center=self.rect.center)
         self.build(text_surface, text_rect)
 
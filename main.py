@@ -1,33 +1,46 @@
+from time import perf_counter
+_PROCESS_START = perf_counter()  # before the heavy imports, for --profile-startup
+
 import sys
 from enum import Enum
-from time import time
 
 import pygame
 from pygame.locals import QUIT
 
-from commands import (
-    Commands,
-    parse_arg,
-)
-from components import (
-    WordRunningBoard,
-    TowerManager,
+from engine import (
+    GameEngine,
+    Levels,
 )
 from items import (
+    BoardView,
     Button,
     Item,
     UserInputDisplay,
     GameInfo,
-    RunningWord,
     ErrorMessage,
     HelpInfo,
+    HistoryChart,
+    ProfilerOverlay,
+    TowerView,
 )
 from utils import (
+    BackgroundLoader,
+    Clock,
     Colors,
+    FontRegistry,
+    FrameProfiler,
     GUIDE_CONTENT,
+    NullProfiler,
     PygameFunction,
-    InfoTable,
-    plot_history,
+    RealTimeClock,
+    ScaledClock,
+    StartupProfiler,
+    TextCache,
+)
+from sessions import SessionStore
+from vocabulary import (
+    get_vocabulary,
+    use_vocabulary,
 )
 
 
@@ -39,10 +52,9 @@ class Pages(Enum):
     main = "main"
     exit = "exit"
 
-class Levels(Enum):
-    easy = "easy"
-    medium = "medium"
-    hard = "hard"
+class RenderModes(Enum):
+    full = "full"    # fill and push the whole window every frame
+    dirty = "dirty"  # erase and push only the regions items touched
 
 class App:
     # pygame constants
@@ -50,44 +62,56 @@ class App:
 
     # app constants
     _game_level = None
-    _max_score = None
-    _MIN_SCORE = -20
-    _level_config_table = {             # (max_score, running_word_speed, word_generate_cycle)
-        Levels.easy: (50, 2, 2),
-        Levels.medium: (100, 3, 1.5),
-        Levels.hard: (150, 4, 1.5),
-    }
-
-    def __init__(self, height, width, fps):
+
+    # simulation runs at a fixed tick rate, rendering takes whatever is left
+    _TICK_RATE = 60
+    _MAX_FRAME_TIME = 0.25  # sec, caps the catch-up after a stall
+
+    def __init__(self, height, width, fps, render_mode: RenderModes=RenderModes.full, interpolate: bool=True, profile: bool=False, record_path: str=None, clock: Clock=None, startup: StartupProfiler=None, bot_wpm: float=None):
         # pygame setting
         self._running = False
-        self._pause = False
         self._exit = False
         self._display_surf = None
         self._fps = fps
         self._frame_per_sec = None
+        self._render_mode = render_mode
+        self._interpolate = interpolate
+        self._record_path = record_path
+        self._games = 0
+        self._bot_wpm = bot_wpm  # a bot.Bot plays instead of the keyboard
+        self.clock = RealTimeClock() if clock is None else clock
+        self._prev_dirty_rects = []
+        self._full_redraw = True
+        self._startup = startup  # reported once the first game frame is drawn
+        self._loader = None
 
         # app setting
         self.size = self.width, self.height = width, height
         self.page = Pages.home
-        self.board = None
-        self.tower_manager = None
+        self.engine = GameEngine()
+        self.board_view = None
+        self.tower_view = None
         self.user_input_display = None
         self.game_info = None
         self.error_msg = None
-        self.pause_time = None
-
-        self._info_table = InfoTable()
+        self.profiler_overlay = None
+        self.profiler = NullProfiler()
+        self.session_store = SessionStore()
+        if profile:
+            self.toggle_profiler()
 
         self.on_init()
     
     def on_init(self):
+        self.mark_startup("app")
+
         # pygame setting
         pygame.init()
         pygame.key.set_repeat(500, 50)  # Delay: 500 ms, Interval: 50 ms
         self._display_surf = pygame.display.set_mode(self.size)
         self._frame_per_sec = pygame.time.Clock()
         pygame.display.set_caption("文字防線")
+        self.mark_startup("display")
 
         # app setting
         self.pages_loop = {
@@ -98,31 +122,46 @@ class App:
             Pages.exit: self.exit_loop,
         }
         Item.set_display_serf(self._display_surf)
-        
+
+        # the word list loads while the menus are shown
+        self._loader = BackgroundLoader({"vocabulary": get_vocabulary}, self._startup)
+        self._loader.start()
+
+    def mark_startup(self, stage: str):
+        if self._startup is not None:
+            self._startup.mark(stage)
+
     def on_start(self):
         # layout args
         info_buttom_padding = 40
 
-        # components setting
-        if self.board is None:
-            self.board = WordRunningBoard(10, (0, 10), self.width)
-        self.board.clear()
+        # game state
+        if self._loader is not None:
+            self.mark_startup("menus")
+            self._loader.wait()
+            self._loader = None
+            self.mark_startup("wait for assets")
+        self.engine.reset()
+
+        # views setting
+        if self.board_view is None:
+            self.board_view = BoardView(self.engine.board, (0, 10), self.width)
 
-        if self.tower_manager is None:
-            self.tower_manager = TowerManager()
-        self.tower_manager.clear()
+        if self.tower_view is None:
+            self.tower_view = TowerView(self.engine.tower_manager)
 
         if self.user_input_display is None:
             self.user_input_display = UserInputDisplay((20, self.height - info_buttom_padding))
-        self.user_input_display.clear()
 
         if self.game_info is None:
             self.game_info = GameInfo((670, self.height - info_buttom_padding))
-        self._info_table.reset()
 
         if self.error_msg is None:
             self.error_msg = ErrorMessage((450, self.height - info_buttom_padding))
         self.error_msg.reset()
+
+        if self.profiler_overlay is None:
+            self.profiler_overlay = ProfilerOverlay((760, 10))
     
     def on_event(self, event):
         if event.type == QUIT:
@@ -130,109 +169,70 @@ class App:
             self._exit = True
             return
 
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            self.toggle_profiler()
+            return
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F4 and self.profiler.enabled:
+            print(f"profile trace saved to {self.profiler.export()}")
+            return
+
         if self.page == Pages.home:
             pass
         elif self.page == Pages.main:
             key = PygameFunction.read_key(event)
             if key is not None:
-                self.user_input_display.read(key)
-                if self.user_input_display.is_full():
-                    self.error_msg.input_full_warning()
-                if self._pause:
-                    self._pause = False
-                    self._info_table._start_time += time() - self.pause_time
+                self.engine.read_key(key)
         elif self.page == Pages.help:
             pass
         else:
             pass
     
-    def command_handler(self, input_str):
-        if not input_str or input_str[-1] != '\n':
-            return
+    def toggle_profiler(self):
+        self.profiler = NullProfiler() if self.profiler.enabled else FrameProfiler()
+        self.engine.profiler = self.profiler
 
-        command_str = parse_arg(input_str)
-        if command_str[0] == Commands.pause.value:
-            if len(command_str) > 1:
-                self.error_msg.param_error()
-            else:
-                self._pause = True
-                self.pause_time = time()
-        elif command_str[0] == Commands.tower.value:
-            if len(command_str) != 2:
-                self.error_msg.param_error()
-            else:
-                try:
-                    ypos = int(command_str[1])
-                    if ypos <= 0 or ypos > 10:
-                        self.error_msg.param_error()
-                    elif self.board.lines[ypos - 1].tower is not None:
-                        self.error_msg.tower_error()
-                    else:
-                        new_toewr = self.tower_manager.add_tower(ypos, self._info_table)
-                        if new_toewr is None:
-                            self.error_msg.tower_error()
-                        else:
-                            self.board.lines[ypos - 1].tower = new_toewr
-                except ValueError:
-                    self.error_msg.param_error()
-        else:
-            self.error_msg.unknown_command_error()
-        self.user_input_display.mode = self.user_input_display._TYPING_MODE
-        self.user_input_display.clear()
-    
-    def collision_handler(self):
-        for i, first_bullet in enumerate(self.tower_manager.first_bullets):
-            for j, first_word in enumerate(self.board.first_words):
-                if first_bullet is None or first_word is None:
-                    continue
-                if first_bullet.body.colliderect(first_word.body):
-                    self.tower_manager.towers[i].bullet_queue.pop(0)
-                    self.board.lines[j].word_queue.pop(0)
-    
-    def update_game_info(self):
-        self._info_table.score += self.board.total_match_word_score
-        self._info_table.score -= self.board.total_oob_word_score
-        total_word_num = self.board.total_char_num/5
-
-        try:
-            if not self._pause:
-                self._info_table.wpm = total_word_num/self._info_table.timer*60
-        except ZeroDivisionError:
-            self._info_table.wpm = 0.0
-
-        self.game_info.update(self._info_table)
-        self.error_msg.update()
-        self._info_table.checkpoint()
-    
-    def update_items(self):
-        user_input = self.user_input_display.inputbox
-        self.board.update(user_input, is_pause=self._pause)
-        self.tower_manager.update(is_pause=self._pause)
-
-        is_match = self.board.is_match
-        input_str = self.user_input_display.update(is_match)
+    def render_items(self, alpha: float=1.0):
+        now = self.clock.now
+        for error in self.engine.drain_errors():
+            self.error_msg.show(error, now)
 
-        pygame.draw.line(self._display_surf, Colors.WHITE.value, (0, self.height - 50), (self.width, self.height - 50), 3)
+        self.board_view.update(alpha)
+        self.tower_view.update(self.engine.now, alpha)
+        self.user_input_display.update(self.engine.input_buffer)
 
-        if self.user_input_display.mode == UserInputDisplay._COMMAND_MODE:
-            self.command_handler(input_str)
-        self.collision_handler()
-        self.update_game_info()
+        Item.track(pygame.draw.line(self._display_surf, Colors.WHITE.value, (0, self.height - 50), (self.width, self.height - 50), 3))
+        self.profiler.mark("render")
 
-        score = self._info_table.score
-        is_over = (
-            score <= self._MIN_SCORE or
-            score >= self._max_score
-        )
+        self.game_info.update(self.engine.info_table, now)
+        self.error_msg.update(now)
+        self.profiler.mark("hud")
 
-        return is_over
+        if self.profiler.enabled:
+            self.profiler_overlay.update(self.profiler, now)
+            self.profiler.mark("overlay")
     
     def on_render(self):
-        pygame.display.update()
+        dirty_rects = Item.flush_dirty_rects()
+
+        if self._render_mode == RenderModes.full or self._full_redraw:
+            pygame.display.update()
+            self._full_redraw = False
+        else:
+            # previous rects are pushed too so erased items disappear from the window
+            pygame.display.update(self._prev_dirty_rects + dirty_rects)
+        self._prev_dirty_rects = dirty_rects
+        self.profiler.mark("display")
+
         self._frame_per_sec.tick(self._fps)
+        self.profiler.mark("idle")
     
     def on_cleanup(self):
-        self._display_surf.fill(self._BACKGROUND_COLOR)
+        if self._render_mode == RenderModes.full or self._full_redraw:
+            self._display_surf.fill(self._BACKGROUND_COLOR)
+            return
+
+        for rect in self._prev_dirty_rects:
+            self._display_surf.fill(self._BACKGROUND_COLOR, rect)
     
     def home_loop(self):
         gap, padding = 100, 10
@@ -251,6 +251,8 @@ class App:
             start_button.draw()
             help_button.draw()
             self.on_render()
+            if self._startup is not None and self._startup.stages[-1][0] == "display":
+                self.mark_startup("first frame")
 
     def level_loop(self):
         gap, padding = 100, 10
@@ -271,8 +273,7 @@ class App:
                 if self._game_level is not None:
                     self.page = Pages.main
                     self._running = False
-                    self._max_score, RunningWord._RUNNING_SPEED, WordRunningBoard._GENERATE_CYCLE = \
-                        self._level_config_table[self._game_level]
+                    self.engine.set_level(self._game_level)
 
             self.on_cleanup()
             easy_button.draw()
@@ -282,19 +283,51 @@ class App:
     
     def main_loop(self):
         self.on_start()
-        is_over = False
+        tick = 1/self._TICK_RATE
+        accumulator = 0.0
+        max_frame_time = self._MAX_FRAME_TIME*self.clock.scale
+        self.clock.sample()  # drop the time spent in the menus
+        self._games += 1
+        recorder = None
+        if self._record_path:
+            from replay import SessionRecorder, game_path
+            recorder = SessionRecorder(game_path(self._record_path, self._games), self.engine, tick)
+        bot = None
+        if self._bot_wpm:
+            from bot import Bot
+            bot = Bot(self.engine, self._bot_wpm)
 
         while self._running:
+            self.profiler.begin_frame()
             for event in pygame.event.get():
                 self.on_event(event)
-            self.on_cleanup()
-            is_over = self.update_items()
+            self.profiler.mark("events")
+
+            accumulator += min(self.clock.sample(), max_frame_time)
 
-            if is_over:
-                self.page = Pages.exit
-                self._running = False
+            while accumulator >= tick and self._running:
+                accumulator -= tick
+                if bot is not None:
+                    bot.step(tick)
+                is_over = self.engine.step(tick)
 
+                if is_over:
+                    self.engine.info_table.save(self.session_store, level=self.engine.level.value, seed=self.engine.seed)
+                    self.page = Pages.exit
+                    self._running = False
+
+            self.on_cleanup()
+            self.render_items(accumulator/tick if self._interpolate else 1.0)
             self.on_render()
+            self.profiler.end_frame()
+
+            if self._startup is not None:
+                self.mark_startup("first game frame")
+                print(self._startup.report())
+                self._startup = None
+
+        if recorder is not None:
+            recorder.close()
     
     def help_loop(self):
         gap, padding = 70, 10
@@ -316,10 +349,18 @@ class App:
         again_button = Button(self.width/2, self.height/2 - gap - padding, "again !")
         check_record_button = Button(self.width/2, self.height/2, "check info")
         exit_button = Button(self.width/2, self.height/2 + gap + padding, "exit")
+        chart = HistoryChart(self.size)
 
         while self._running:
             for event in pygame.event.get():
                 self.on_event(event)
+                if chart.visible:
+                    # any click or key goes back to the buttons
+                    if event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN):
+                        chart.close()
+                        self.on_cleanup()
+                        self._full_redraw = True
+                    continue
                 '''
                 TODO: wraping this handle_event() into on_event()
                 '''
@@ -328,30 +369,94 @@ class App:
                     self._game_level = None
                     self._running = False
                 elif check_record_button.handle_event(event):
-                    '''
-                    BUG: after ploting performance, the game window will change its size automatically...
-                    '''
-
-                    plot_history(self._info_table._history, self._info_table.timer)
+                    chart.open(self.engine.info_table._history, self.engine.info_table.timer, self.session_store.path)
                 elif exit_button.handle_event(event):
                     self._exit = True
                     self._running = False
-            again_button.draw()
-            check_record_button.draw()
-            exit_button.draw()
+
+            if chart.visible:
+                chart.update()
+            else:
+                again_button.draw()
+                check_record_button.draw()
+                exit_button.draw()
             self.on_render()
+        chart.cancel()
 
     def on_execute(self):
         while not self._exit:
             self._running = True
+            self._full_redraw = True
             self.pages_loop[self.page]()
 
+        self.session_store.close()
+        TextCache.clear()
+        FontRegistry.clear()
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--render-mode",
+        choices=[mode.value for mode in RenderModes],
+        default=RenderModes.full.value,
+        help="full: redraw the whole window every frame, dirty: redraw only changed regions",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="start with the frame profiler on (F3 toggles it, F4 saves the trace to ./profile)",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print import, asset and first frame timings once the game starts",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        default=None,
+        help="record each game's seed and keystrokes to PATH (later games of the run to PATH-2, PATH-3, ...), replay it with replay.py",
+    )
+    parser.add_argument(
+        "--words",
+        metavar="PATH",
+        default=None,
+        help="word list to play with, one word per line like words.txt, in any script fonts/word.ttf can draw",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="game seconds per real second, e.g. 4 to play four times faster",
+    )
+    parser.add_argument(
+        "--no-interpolate",
+        action="store_true",
+        help="draw the last simulated positions instead of interpolating between ticks",
+    )
+    parser.add_argument(
+        "--bot",
+        type=float,
+        metavar="WPM",
+        default=None,
+        help="let a bot play at WPM words per minute, e.g. to watch a level or record a session",
+    )
+    args = parser.parse_args()
+
+    startup = None
+    if args.profile_startup:
+        startup = StartupProfiler(_PROCESS_START)
+        startup.mark("imports")
+
     height, width = 500, 1000
     fps = 30
 
-    app = App(height, width, fps)
+    if args.words is not None:
+        use_vocabulary(args.words)
+    clock = RealTimeClock() if args.time_scale == 1.0 else ScaledClock(args.time_scale)
+    app = App(height, width, fps, RenderModes(args.render_mode), not args.no_interpolate, args.profile, args.record, clock, startup, args.bot)
     app.on_execute()
\ No newline at end of file
@@ -0,0 +1,337 @@
+'''
+compact binary encoding of board state for streaming to players and spectators.
+a StateTracker turns an engine into one Delta per tick (spawned words, removed
+words, new towers, score and wpm changes) and into a keyframe with every live
+word every so often, so late joiners and lossy readers resync.
+
+frame, little endian:
+
+    kind u8 | tick u32 | flags u8 | [score i32] [wpm u16, 0.1 steps]
+    | spawns u16 | (slot u16, word id u32, line u8, x i16 in 1/16 px)*
+    | removes u16 | slot u16* | towers u8 | line u8*
+
+words are sent as vocabulary ids and move at the board speed, so a spawn is
+sent once and the receiver extrapolates x from it. flags also carry the pause
+state when it changes, words stand still while the board is paused.
+
+    python protocol.py    # encode/decode throughput and size against json
+'''
+import json
+import struct
+from typing import List, Tuple
+
+from engine import GameEngine
+
+KEYFRAME = 1
+DELTA = 2
+OVER = 3  # final score, the stream ends
+
+_X_SCALE = 16  # fixed point steps per px, i16 covers +-2048 px
+_KEYFRAME_INTERVAL = 150  # ticks
+
+_HEADER = struct.Struct("<BIB")
+_SCORE = struct.Struct("<i")
+_WPM = struct.Struct("<H")
+_COUNT = struct.Struct("<H")
+_SPAWN = struct.Struct("<HIBh")
+_HAS_SCORE = 1
+_HAS_WPM = 2
+_HAS_PAUSE = 4
+_PAUSED = 8
+_JSON_OPS = {KEYFRAME: "key", DELTA: "tick", OVER: "over"}
+
+
+class Delta:
+    __slots__ = ("kind", "tick", "spawn", "remove", "towers", "score", "wpm", "paused")
+
+    def __init__(self, kind: int, tick: int, spawn: List[Tuple[int, int, int, float]]=None, remove: List[int]=None,
+                 towers: List[int]=None, score: int=None, wpm: float=None, paused: bool=None):
+        self.kind = kind
+        self.tick = tick
+        self.spawn = spawn or []    # (slot, word id, line, x)
+        self.remove = remove or []  # slots
+        self.towers = towers or []  # lines
+        self.score = score          # None when unchanged
+        self.wpm = wpm
+        self.paused = paused
+
+    def __bool__(self):
+        return bool(
+            self.kind == KEYFRAME or self.spawn or self.remove or self.towers or
+            self.score is not None or self.wpm is not None or self.paused is not None
+        )
+
+    def to_json(self):
+        message = {"op": _JSON_OPS[self.kind], "tick": self.tick}
+        if self.spawn:
+            message["spawn"] = [[slot, word_id, line, round(x, 1)] for slot, word_id, line, x in self.spawn]
+        if self.remove:
+            message["remove"] = self.remove
+        if self.towers:
+            message["towers"] = self.towers
+        if self.score is not None:
+            message["score"] = self.score
+        if self.wpm is not None:
+            message["wpm"] = self.wpm
+        if self.paused is not None:
+            message["paused"] = self.paused
+        return message
+
+    @classmethod
+    def from_json(cls, message: dict):
+        kind = next(kind for kind, op in _JSON_OPS.items() if op == message["op"])
+        return cls(
+            kind,
+            message["tick"],
+            spawn=[tuple(entry) for entry in message.get("spawn", ())],
+            remove=message.get("remove"),
+            towers=message.get("towers"),
+            score=message.get("score"),
+            wpm=message.get("wpm"),
+            paused=message.get("paused"),
+        )
+
+
+def encode(delta: Delta):
+    flags = (_HAS_SCORE if delta.score is not None else 0) | (_HAS_WPM if delta.wpm is not None else 0)
+    if delta.paused is not None:
+        flags |= _HAS_PAUSE | (_PAUSED if delta.paused else 0)
+    parts = [_HEADER.pack(delta.kind, delta.tick, flags)]
+    if delta.score is not None:
+        parts.append(_SCORE.pack(delta.score))
+    if delta.wpm is not None:
+        parts.append(_WPM.pack(min(int(round(delta.wpm*10)), 0xffff)))
+
+    parts.append(_COUNT.pack(len(delta.spawn)))
+    parts.extend(_SPAWN.pack(slot, word_id, line, int(round(x*_X_SCALE))) for slot, word_id, line, x in delta.spawn)
+    parts.append(struct.pack(f"<H{len(delta.remove)}H", len(delta.remove), *delta.remove))
+    parts.append(bytes((len(delta.towers), *delta.towers)))
+    return b"".join(parts)
+
+def decode(frame: bytes):
+    kind, tick, flags = _HEADER.unpack_from(frame)
+    pos = _HEADER.size
+    delta = Delta(kind, tick)
+    if flags & _HAS_PAUSE:
+        delta.paused = bool(flags & _PAUSED)
+    if flags & _HAS_SCORE:
+        delta.score, = _SCORE.unpack_from(frame, pos)
+        pos += _SCORE.size
+    if flags & _HAS_WPM:
+        delta.wpm = _WPM.unpack_from(frame, pos)[0]/10
+        pos += _WPM.size
+
+    count, = _COUNT.unpack_from(frame, pos)
+    pos += _COUNT.size
+    end = pos + count*_SPAWN.size
+    delta.spawn = [(slot, word_id, line, x/_X_SCALE) for slot, word_id, line, x in _SPAWN.iter_unpack(frame[pos:end])]
+    pos = end
+
+    count, = _COUNT.unpack_from(frame, pos)
+    pos += _COUNT.size
+    delta.remove = list(struct.unpack_from(f"<{count}H", frame, pos))
+    pos += count*2
+
+    count = frame[pos]
+    delta.towers = list(frame[pos + 1:pos + 1 + count])
+    return delta
+
+
+class StateTracker:
+    '''
+    remembers what a stream was last sent and diffs the engine against it
+    '''
+    def __init__(self, keyframe_interval: int=_KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self._words = {}  # slot -> word id
+        self._tower_num = 0
+        self._score = None
+        self._wpm = None
+        self._paused = None
+        self._last_keyframe = None
+
+    def _current_words(self, engine: GameEngine):
+        words = engine.board.words
+        slots = words.slots
+        return words, dict(zip(slots.tolist(), words.word_id[slots].tolist()))
+
+    def request_keyframe(self):
+        # e.g. for a new spectator, the next delta is a keyframe
+        self._last_keyframe = None
+
+    def keyframe(self, engine: GameEngine):
+        words, current = self._current_words(engine)
+        self._words = current
+        self._tower_num = len(engine.tower_manager.towers)
+        self._score = engine.info_table.score
+        self._wpm = round(engine.info_table.wpm, 1)
+        self._paused = engine.is_pause
+        self._last_keyframe = engine.tick
+
+        return Delta(
+            KEYFRAME,
+            engine.tick,
+            spawn=[(slot, word_id, int(words.line[slot]), float(words.x[slot])) for slot, word_id in current.items()],
+            towers=[tower.line for tower in engine.tower_manager.towers if not tower.is_expired(engine.now)],
+            score=self._score,
+            wpm=self._wpm,
+            paused=self._paused,
+        )
+
+    def delta(self, engine: GameEngine):
+        if self._last_keyframe is None or engine.tick - self._last_keyframe >= self.keyframe_interval:
+            return self.keyframe(engine)
+
+        words, current = self._current_words(engine)
+        delta = Delta(DELTA, engine.tick)
+        delta.spawn = [
+            (slot, word_id, int(words.line[slot]), float(words.x[slot]))
+            for slot, word_id in current.items()
+            if self._words.get(slot) != word_id
+        ]
+        delta.remove = [slot for slot, word_id in self._words.items() if current.get(slot) != word_id]
+        self._words = current
+
+        towers = engine.tower_manager.towers
+        delta.towers = [tower.line for tower in towers[self._tower_num:]]
+        self._tower_num = len(towers)
+
+        info_table = engine.info_table
+        if info_table.score != self._score:
+            delta.score = self._score = info_table.score
+        wpm = round(info_table.wpm, 1)
+        if wpm != self._wpm:
+            delta.wpm = self._wpm = wpm
+        if engine.is_pause != self._paused:
+            delta.paused = self._paused = engine.is_pause
+        return delta
+
+class BoardMirror:
+    '''
+    receiver side: rebuilds the live words from frames, x is extrapolated from the spawn
+    '''
+    def __init__(self, speed: float, dt: float):
+        self.speed = speed
+        self.dt = dt
+        self.tick = 0
+        self.words = {}  # slot -> (word id, line, x, tick)
+        self.towers = []
+        self.score = None
+        self.wpm = None
+        self.paused = False
+
+    def apply(self, delta: Delta):
+        if delta.kind == KEYFRAME:
+            self.words.clear()
+            self.towers = []
+        elif delta.paused is not None and delta.paused != self.paused:
+            # words moved until this tick when pausing, and move again from the previous one on resume
+            moved_until = delta.tick if delta.paused else delta.tick - 1
+            self.words = {
+                slot: (word_id, line, self.x(slot, moved_until), moved_until)
+                for slot, (word_id, line, _, _) in self.words.items()
+            }
+        if delta.paused is not None:
+            self.paused = delta.paused
+        for slot in delta.remove:
+            self.words.pop(slot, None)
+        for slot, word_id, line, x in delta.spawn:
+            self.words[slot] = (word_id, line, x, delta.tick)
+        self.towers += delta.towers
+        if delta.score is not None:
+            self.score = delta.score
+        if delta.wpm is not None:
+            self.wpm = delta.wpm
+        self.tick = delta.tick
+
+    def x(self, slot: int, tick: int=None):
+        # quiet ticks send no frame, so the caller may be ahead of the last one
+        _, _, x, spawn_tick = self.words[slot]
+        if self.paused:
+            return x
+        return x + self.speed*((self.tick if tick is None else tick) - spawn_tick)*self.dt
+
+
+def naive_json(engine: GameEngine):
+    # the whole board with word texts, what serializing the objects each tick would send
+    words = engine.board.words
+    bullets = engine.tower_manager.bullets
+    return json.dumps({
+        "tick": engine.tick,
+        "score": engine.info_table.score,
+        "wpm": engine.info_table.wpm,
+        "words": [
+            {"text": engine.board.word_text(slot), "x": float(words.x[slot]), "line": int(words.line[slot]), "score": int(words.score[slot])}
+            for slot in words.slots.tolist()
+        ],
+        "bullets": [{"x": float(bullets.x[slot]), "line": int(bullets.line[slot])} for slot in bullets.slots.tolist()],
+        "towers": [{"line": tower.line, "create_time": tower.create_time} for tower in engine.tower_manager.towers],
+    }).encode("utf-8")
+
+
+def main():
+    from time import perf_counter
+
+    from engine import Levels
+
+    # a typist that clears the oldest word, keeps towers up and pauses now and then, so every field changes
+    engine = GameEngine(Levels.hard)
+    engine.reset(0)
+    engine.max_score = float("inf")
+    tracker = StateTracker()
+    mirror = BoardMirror(engine.board.speed, 1/30)
+
+    frames, typing = [], ""
+    naive_bytes = json_bytes = 0
+    encode_time = decode_time = 0.0
+    drift = 0.0
+    resume = 0  # tick the typist comes back after a pause, any key resumes the game
+    for i in range(9000):
+        if i % 4 == 0 and i >= resume:
+            if not typing:
+                slots = engine.board.words.slots
+                typing = engine.board.word_text(int(slots[0])) if len(slots) else ""
+                if i % 600 == 0:
+                    engine.info_table.score += 10
+                    typing = f"/tower {i//600 % 10 + 1}\n"
+                elif i % 1800 >= 900:
+                    typing = "/pause\n"
+                    resume = i + 4*len(typing) + 120
+            if typing:
+                engine.read_key(typing[0])
+                typing = typing[1:]
+        engine.step(1/30)
+
+        start = perf_counter()
+        delta = tracker.delta(engine)
+        frame = encode(delta) if delta else None
+        encode_time += perf_counter() - start
+
+        if frame is not None:
+            start = perf_counter()
+            mirror.apply(decode(frame))
+            decode_time += perf_counter() - start
+
+            frames.append(frame)
+            json_bytes += len(json.dumps(delta.to_json(), separators=(',', ':'))) + 1
+            naive_bytes += len(naive_json(engine))
+
+        # quiet ticks too, the mirror extrapolates through them
+        live = engine.board.words.slots.tolist()
+        assert sorted(mirror.words) == live, "Error: mirror out of sync"
+        if live:
+            drift = max(drift, max(abs(mirror.x(slot, engine.tick) - engine.board.words.x[slot]) for slot in live))
+
+    assert drift < 1, f"Error: mirror positions drifted {drift:.1f} px"
+
+    seconds = 9000/30
+    binary_bytes = sum(map(len, frames))
+    print(f"{len(frames)} frames over {seconds:.0f}s, mirror in sync, max drift {drift:.2f} px")
+    print(f"encode {encode_time/9000*1e6:.2f} us/tick | decode {decode_time/len(frames)*1e6:.2f} us/frame")
+    print(f"{'format':<14}{'bytes/s':>10}{'vs binary':>11}")
+    for name, size in (("binary", binary_bytes), ("json delta", json_bytes), ("naive json", naive_bytes)):
+        print(f"{name:<14}{size/seconds:>10.0f}{size/binary_bytes:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
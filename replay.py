@@ -0,0 +1,250 @@
+'''
+record and replay of game sessions. a session is fully described by its seed,
+level, tick length and the keys read before every tick, stored compactly as
+
+    b"WGR2" | header | event* | end event | summary
+
+header and summary are varint length prefixed json, an event is the varint
+tick delta since the previous event, a tag byte and, for a char key, the key
+as utf-8. any char is recorded as is, control chars included.
+
+    python replay.py session.wgr            # headless, as fast as possible
+    python replay.py session.wgr --render   # through the pygame view, no frame cap
+    python replay.py --check 16             # bot games recorded with the views attached must replay headless
+'''
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+from typing import BinaryIO
+
+from engine import GameEngine, Levels
+from utils import PygameFunction
+
+_MAGIC = b"WGR2"
+# event tags
+_END = 0
+_CHAR = 1
+# keys that are not a single char
+_KEY_TAGS = {
+    PygameFunction.KEY_BACKSPACE: 2,
+    "": 3,  # keys without unicode, e.g. shift
+}
+_TAG_KEYS = {v: k for k, v in _KEY_TAGS.items()}
+
+
+def _write_varint(f: BinaryIO, n: int):
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            f.write(bytes((byte | 0x80,)))
+        else:
+            f.write(bytes((byte,)))
+            return
+
+def _read_varint(f: BinaryIO):
+    n = shift = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            raise EOFError
+        n |= (byte[0] & 0x7f) << shift
+        if byte[0] < 0x80:
+            return n
+        shift += 7
+
+def _write_json(f: BinaryIO, obj):
+    data = json.dumps(obj, separators=(',', ':')).encode("utf-8")
+    _write_varint(f, len(data))
+    f.write(data)
+
+def _read_json(f: BinaryIO):
+    return json.loads(f.read(_read_varint(f)).decode("utf-8"))
+
+def _read_char(f: BinaryIO):
+    first = f.read(1)
+    if not first:
+        raise EOFError
+    # utf-8 sequence length from the leading byte
+    size = 1 if first[0] < 0x80 else 2 if first[0] < 0xe0 else 3 if first[0] < 0xf0 else 4
+    return (first + f.read(size - 1)).decode("utf-8")
+
+
+class SessionRecorder:
+    def __init__(self, path: str, engine: GameEngine, dt: float):
+        self.engine = engine
+        self._file = open(path, 'wb')
+        self._last_tick = 0
+
+        self._file.write(_MAGIC)
+        _write_json(self._file, {"seed": engine.seed, "level": engine.level.value, "dt": dt})
+        engine.recorder = self
+
+    def _write_event(self, tick: int, tag: int, char: str=""):
+        _write_varint(self._file, tick - self._last_tick)
+        self._file.write(bytes((tag,)) + char.encode("utf-8"))
+        self._last_tick = tick
+
+    def record(self, tick: int, key: str):
+        tag = _KEY_TAGS.get(key)
+        if tag is None:
+            self._write_event(tick, _CHAR, key)
+        else:
+            self._write_event(tick, tag)
+
+    def close(self):
+        # the summary lets a replay verify it reached the same state
+        self._write_event(self.engine.tick, _END)
+        _write_json(self._file, {"ticks": self.engine.tick, "score": self.engine.info_table.score})
+        self._file.close()
+        self.engine.recorder = None
+
+def game_path(path: str, game: int):
+    # one recording per game of a run: session.wgr, session-2.wgr, ...
+    if game <= 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{game}{ext}"
+
+class SessionReplayer:
+    def __init__(self, path: str):
+        self.events = []  # (tick, key)
+        self.summary = None
+
+        with open(path, 'rb') as f:
+            assert f.read(len(_MAGIC)) == _MAGIC, f"Error: {path} is not a session recording"
+            header = _read_json(f)
+            tick = 0
+            try:
+                while True:
+                    tick += _read_varint(f)
+                    tag = f.read(1)
+                    if not tag:
+                        raise EOFError
+                    if tag[0] == _END:
+                        self.summary = _read_json(f)
+                        break
+                    self.events.append((tick, _read_char(f) if tag[0] == _CHAR else _TAG_KEYS[tag[0]]))
+            except EOFError:
+                pass  # unfinished recording, replay what was written
+
+        self.seed = header["seed"]
+        self.level = Levels(header["level"])
+        self.dt = header["dt"]
+        self.ticks = self.summary["ticks"] if self.summary else (self.events[-1][0] if self.events else 0)
+        self._cursor = 0
+
+    def start(self, engine: GameEngine):
+        engine.set_level(self.level)
+        engine.reset(self.seed)
+        self._cursor = 0
+
+    def feed(self, engine: GameEngine):
+        # keys read before the current tick, exactly as they were recorded
+        while self._cursor < len(self.events) and self.events[self._cursor][0] <= engine.tick:
+            engine.read_key(self.events[self._cursor][1])
+            self._cursor += 1
+
+    def is_done(self, engine: GameEngine):
+        return engine.tick >= self.ticks
+
+    def verify(self, engine: GameEngine):
+        return self.summary is None or self.summary["score"] == engine.info_table.score
+
+    def run(self, engine: GameEngine=None):
+        if engine is None:
+            engine = GameEngine()
+        self.start(engine)
+        while not self.is_done(engine):
+            self.feed(engine)
+            engine.step(self.dt)
+        return engine
+
+
+def replay_rendered(replayer: SessionReplayer):
+    import pygame
+    from main import App
+    from utils import ManualClock
+
+    clock = ManualClock()  # the view follows game time, however fast it runs
+    app = App(500, 1000, 0, clock=clock)  # fps 0: no frame cap
+    app.on_start()
+    replayer.start(app.engine)
+    while not replayer.is_done(app.engine):
+        pygame.event.pump()
+        replayer.feed(app.engine)
+        app.engine.step(replayer.dt)
+        clock.advance(replayer.dt)
+        clock.sample()
+        app.on_cleanup()
+        app.render_items()
+        app.on_render()
+    return app.engine
+
+
+def check_headless(games: int, seconds: float=120, dt: float=1/60):
+    '''
+    records bot games on one engine with the pygame views attached, reset between
+    games like main.py's "again !", and replays each headless on a fresh engine.
+    returns the seeds whose replay differs
+    '''
+    import os
+    import tempfile
+
+    import numpy as np
+    import pygame
+
+    from bot import Bot
+    from items import BoardView, Item, TowerView
+
+    pygame.font.init()
+    Item.set_display_serf(pygame.Surface((GameEngine._LINE_BOUNDRY, 500)))  # offscreen, no window
+    engine = GameEngine(Levels.hard)
+    BoardView(engine.board, (0, 10), engine._LINE_BOUNDRY)
+    TowerView(engine.tower_manager)
+    differs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed in range(games):
+            path = os.path.join(tmp, f"{seed}.wgr")
+            engine.reset(seed)
+            bot = Bot(engine, wpm=30 + 5*(seed % 8), rng=np.random.default_rng(seed))  # slow bots lean on towers
+
+            recorder = SessionRecorder(path, engine, dt)
+            while not engine.is_over and engine.now < seconds:
+                bot.step(dt)
+                engine.step(dt)
+            recorder.close()
+
+            replayer = SessionReplayer(path)
+            if not replayer.verify(replayer.run()):
+                differs.append(seed)
+    return differs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs='?')
+    parser.add_argument("--render", action="store_true", help="replay through the pygame view")
+    parser.add_argument("--check", type=int, metavar="GAMES", default=None, help="record bot games with the views attached and replay them headless")
+    args = parser.parse_args()
+
+    if args.check is not None:
+        differs = check_headless(args.check)
+        print(f"{args.check - len(differs)}/{args.check} recordings replay headless to the same score" + (f", differ: {differs}" if differs else ""))
+        sys.exit(1 if differs else 0)
+    if args.path is None:
+        parser.error("a recording path is required")
+
+    replayer = SessionReplayer(args.path)
+    start = perf_counter()
+    engine = replay_rendered(replayer) if args.render else replayer.run()
+    elapsed = perf_counter() - start
+
+    print(f"{engine.tick} ticks in {elapsed:.3f}s ({engine.tick/elapsed:.0f} ticks/s), {len(replayer.events)} keys")
+    print(f"final score {engine.info_table.score}, {'matches' if replayer.verify(engine) else 'DIFFERS FROM'} the recording")
+
+
+if __name__ == "__main__":
+    main()
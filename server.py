@@ -0,0 +1,340 @@
+'''
+multi-board server: many headless GameEngines in one process, stepped together
+by one asyncio scheduler task and driven over a local socket.
+
+a client sends json lines
+
+    {"op": "join", "level": "easy", "seed": 1}   -> {"op": "joined", "id": 3, "seed": 1, "speed": 60, "dt": 0.033}
+    {"op": "watch", "id": 3}                     -> spectate a board
+    {"op": "keys", "keys": "ab\\b/tower 2\\n"}      -> "\\b" is backspace
+
+a message that is not understood gets {"op": "error", "error": "..."} back, or
+is dropped once the client reads binary frames.
+
+and gets one protocol.Delta per tick its board changed in, periodic keyframes
+and a final one when the game is over. they come as json lines
+
+    {"op": "tick", "tick": 120, "spawn": [[slot, word_id, line, x]], "remove": [slot], "towers": [line], "score": 5, "wpm": 41.2, "paused": true}
+    {"op": "over", "tick": 900, "score": 50}
+
+or, after joining or watching with "binary": true, as protocol frames each
+prefixed with their u32 length.
+
+    python server.py --serve --port 8765     # host boards until interrupted
+    python server.py --boards 300            # load test with local client stand-ins
+'''
+import argparse
+import asyncio
+import json
+import os
+import struct
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+from engine import GameEngine, Levels
+from protocol import (
+    BoardMirror,
+    Delta,
+    OVER,
+    StateTracker,
+    decode,
+    encode,
+)
+from utils import PygameFunction, get_word
+
+_FRAME_LENGTH = struct.Struct("<I")
+_LEVELS = {level.value for level in Levels}
+
+
+class BoardState:
+    '''
+    one hosted game and the sockets that follow it
+    '''
+    def __init__(self, board_id: int, engine: GameEngine):
+        self.id = board_id
+        self.engine = engine
+        self.tracker = StateTracker()
+        self.clients = {}  # writer -> wants binary frames
+
+    def follow(self, writer: asyncio.StreamWriter, binary: bool):
+        self.clients[writer] = binary
+        self.tracker.request_keyframe()
+
+
+class GameServer:
+    _TICK_RATE = 30
+    _MAX_WRITE_BUFFER = 1 << 20  # bytes queued for a client before it is dropped
+    _BACKLOG = 1024
+    _STATS_WINDOW = 300  # ticks
+
+    def __init__(self, tick_rate: int=_TICK_RATE):
+        self.dt = 1/tick_rate
+        self.boards = {}
+        self.tick_times = []
+        self.overruns = 0
+        self.peak_boards = 0
+        self._next_id = 0
+        self._running = False
+
+    # boards
+
+    def create_board(self, level: Levels=Levels.easy, seed: int=None):
+        engine = GameEngine(level)
+        engine.reset(seed)
+        board = BoardState(self._next_id, engine)
+        self.boards[board.id] = board
+        self.peak_boards = max(self.peak_boards, len(self.boards))
+        self._next_id += 1
+        return board
+
+    def step(self):
+        # every board advances one tick, then each gets its delta
+        for board in list(self.boards.values()):
+            engine = board.engine
+            is_over = engine.step(self.dt)
+            delta = board.tracker.delta(engine)
+            if delta:
+                self.broadcast(board, delta)
+            if is_over:
+                self.broadcast(board, Delta(OVER, engine.tick, score=engine.info_table.score))
+                del self.boards[board.id]
+
+    def broadcast(self, board: BoardState, delta: Delta):
+        # each format is encoded once per tick, and only if someone reads it
+        frames = {}
+        for writer, binary in list(board.clients.items()):
+            if writer.transport.get_write_buffer_size() > self._MAX_WRITE_BUFFER:
+                del board.clients[writer]  # too slow to keep up
+                writer.close()
+                continue
+
+            data = frames.get(binary)
+            if data is None:
+                if binary:
+                    frame = encode(delta)
+                    data = _FRAME_LENGTH.pack(len(frame)) + frame
+                else:
+                    data = (json.dumps(delta.to_json(), separators=(',', ':')) + "\n").encode("utf-8")
+                frames[binary] = data
+            writer.write(data)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._running = True
+        next_tick = loop.time()
+        while self._running:
+            start = perf_counter()
+            self.step()
+            self.tick_times.append(perf_counter() - start)
+            if len(self.tick_times) > self._STATS_WINDOW:
+                del self.tick_times[0]
+
+            next_tick += self.dt
+            delay = next_tick - loop.time()
+            if delay < 0:
+                self.overruns += 1
+                next_tick = loop.time()  # drop the missed ticks instead of bursting
+            await asyncio.sleep(max(delay, 0))
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        times = np.array(self.tick_times or [0.0])*1000
+        return {
+            "boards": len(self.boards),
+            "peak_boards": self.peak_boards,
+            "tick_mean_ms": round(float(times.mean()), 3),
+            "tick_p99_ms": round(float(np.percentile(times, 99)), 3),
+            "budget_used": round(float(times.mean())/(self.dt*1000), 3),
+            "overruns": self.overruns,
+        }
+
+    # sockets
+
+    @staticmethod
+    def _validate(message):
+        # the reason a message is rejected, None when it can be handled
+        if not isinstance(message, dict):
+            return "message is not an object"
+        op = message.get("op")
+        if op == "join":
+            seed = message.get("seed")
+            if message.get("level", Levels.easy.value) not in _LEVELS:
+                return f"level must be one of {sorted(_LEVELS)}"
+            if seed is not None and (type(seed) is not int or not 0 <= seed < 2**32):
+                return "seed must be an integer in [0, 2**32)"
+        elif op == "watch":
+            if type(message.get("id")) is not int:
+                return "id must be an integer"
+        elif op == "keys":
+            if not isinstance(message.get("keys", ""), str):
+                return "keys must be a string"
+        else:
+            return f"unknown op {op!r}"
+        return None
+
+    def _handle(self, message: dict, writer: asyncio.StreamWriter, board: BoardState):
+        # returns the board the client plays on, if any, and the error to reply with
+        op = message["op"]
+        if op == "join":
+            if board is not None:
+                return board, "already joined"
+            board = self.create_board(Levels(message.get("level", Levels.easy.value)), message.get("seed"))
+            engine = board.engine
+            reply = {"op": "joined", "id": board.id, "seed": engine.seed, "speed": engine.board.speed, "dt": self.dt}
+            writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+            board.follow(writer, bool(message.get("binary")))
+        elif op == "watch":
+            watched = self.boards.get(message["id"])
+            if watched is None:
+                return board, "no such board"
+            engine = watched.engine
+            reply = {"op": "watching", "id": watched.id, "speed": engine.board.speed, "dt": self.dt}
+            writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+            watched.follow(writer, bool(message.get("binary")))
+        elif op == "keys":
+            if board is None or board.id not in self.boards:
+                return board, "not playing"
+            for key in message.get("keys", ""):
+                board.engine.read_key(PygameFunction.KEY_BACKSPACE if key == '\b' else key)
+        return board, None
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        board = None
+        try:
+            async for line in reader:
+                try:
+                    message = json.loads(line)
+                    error = self._validate(message)
+                    if error is None:
+                        board, error = self._handle(message, writer, board)
+                except (ValueError, TypeError) as e:
+                    error = f"bad message: {e}"
+
+                # json replies would corrupt a binary frame stream
+                if error is not None and not any(state.clients.get(writer) for state in self.boards.values()):
+                    writer.write((json.dumps({"op": "error", "error": error}) + "\n").encode("utf-8"))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for state in self.boards.values():
+                state.clients.pop(writer, None)
+            if board is not None:
+                self.boards.pop(board.id, None)  # players own their board, spectators do not
+            writer.close()
+
+    async def serve(self, host: str="127.0.0.1", port: int=8765, unix_path: str=None):
+        if unix_path is not None:
+            return await asyncio.start_unix_server(self.handle_client, unix_path, backlog=self._BACKLOG)
+        return await asyncio.start_server(self.handle_client, host, port, backlog=self._BACKLOG)
+
+
+class LocalClient:
+    '''
+    stand-in for a remote player: joins a board and types the oldest word on it
+    '''
+    def __init__(self, level: Levels=Levels.easy, seed: int=None, chars_per_sec: float=5.0, binary: bool=False):
+        self.level = level
+        self.seed = seed
+        self.chars_per_sec = chars_per_sec
+        self.binary = binary
+        self.mirror = None
+        self.received = 0  # bytes
+        self.is_over = False
+
+    @property
+    def score(self):
+        return None if self.mirror is None else self.mirror.score
+
+    async def run(self, connect, duration: float):
+        reader, writer = await connect()
+        join = {"op": "join", "level": self.level.value, "seed": self.seed, "binary": self.binary}
+        writer.write((json.dumps(join) + "\n").encode("utf-8"))
+        joined = json.loads(await reader.readline())
+        self.mirror = BoardMirror(joined["speed"], joined["dt"])
+        typer = asyncio.create_task(self._type(writer))
+        try:
+            await asyncio.wait_for(self._read(reader), duration)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            typer.cancel()
+            writer.close()
+
+    async def _read(self, reader: asyncio.StreamReader):
+        while True:
+            if self.binary:
+                length, = _FRAME_LENGTH.unpack(await reader.readexactly(_FRAME_LENGTH.size))
+                frame = await reader.readexactly(length)
+                self.received += _FRAME_LENGTH.size + length
+                delta = decode(frame)
+            else:
+                line = await reader.readline()
+                if not line:
+                    return
+                self.received += len(line)
+                delta = Delta.from_json(json.loads(line))
+
+            self.mirror.apply(delta)
+            if delta.kind == OVER:
+                self.is_over = True
+                return
+
+    async def _type(self, writer: asyncio.StreamWriter):
+        typing = ""
+        while True:
+            await asyncio.sleep(1/self.chars_per_sec)
+            if not typing and self.mirror.words:
+                typing = get_word(self.mirror.words[min(self.mirror.words)][0])
+            if typing:
+                writer.write((json.dumps({"op": "keys", "keys": typing[0]}) + "\n").encode("utf-8"))
+                typing = typing[1:]
+
+
+async def load_test(boards: int, seconds: float, tick_rate: int, binary: bool=False):
+    server = GameServer(tick_rate)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "server.sock")
+        listener = await server.serve(unix_path=path)
+        scheduler = asyncio.create_task(server.run())
+
+        clients = [LocalClient(Levels.hard, seed=i, binary=binary) for i in range(boards)]
+        await asyncio.gather(*(client.run(lambda: asyncio.open_unix_connection(path), seconds) for client in clients))
+        stats = server.stats()
+
+        server.stop()
+        await scheduler
+        listener.close()
+        await listener.wait_closed()
+
+    stats["received_kb_per_board_sec"] = round(sum(client.received for client in clients)/1024/boards/seconds, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", action="store_true", help="host boards until interrupted")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", default=None, help="listen on a unix socket instead of tcp")
+    parser.add_argument("--tick-rate", type=int, default=GameServer._TICK_RATE)
+    parser.add_argument("--boards", type=int, default=100, help="local client stand-ins for the load test")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--binary", action="store_true", help="load test clients read binary frames instead of json")
+    args = parser.parse_args()
+
+    if args.serve:
+        async def serve():
+            server = GameServer(args.tick_rate)
+            await server.serve(args.host, args.port, args.unix)
+            await server.run()
+        asyncio.run(serve())
+    else:
+        print(json.dumps(asyncio.run(load_test(args.boards, args.seconds, args.tick_rate, args.binary))))
+
+
+if __name__ == "__main__":
+    main()
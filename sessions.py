@@ -0,0 +1,125 @@
+'''
+finished games appended to ./history/sessions.jsonl, one json object per line.
+the file is only ever appended to, by a writer thread that batches whatever
+games are queued, so saving never blocks a frame
+
+the per checkpoint history is always the last key of a line, summaries are
+loaded without parsing it
+
+    python sessions.py [path]   # per level summary
+'''
+import json
+import os
+from queue import Empty, Queue
+from threading import Thread
+from typing import Dict, List
+
+_PATH = "./history/sessions.jsonl"
+_HISTORY_KEY = ',"history":'
+
+
+class SessionStore:
+    _STOP = None
+
+    def __init__(self, path: str=_PATH):
+        self.path = path
+        self.written = 0
+        self.error = None
+        self._queue = Queue()
+        self._writer = Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def append(self, session: Dict):
+        self._queue.put(session)
+
+    def _write_loop(self):
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+            if self._STOP in batch:
+                running = False
+                batch = [session for session in batch if session is not self._STOP]
+            if batch:
+                self._write(batch)
+
+    @classmethod
+    def _encode(cls, session: Dict):
+        session = dict(session)
+        if "history" in session:
+            session["history"] = session.pop("history")  # last
+        return json.dumps(session, separators=(',', ':')) + "\n"
+
+    def _write(self, batch: List[Dict]):
+        lines = "".join(self._encode(session) for session in batch)
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding="utf-8") as f:
+                f.write(lines)
+            self.written += len(batch)
+        except OSError as e:
+            self.error = e  # keep playing, the games are just not kept
+
+    def close(self, timeout: float=5.0):
+        # flushes what is queued
+        self._queue.put(self._STOP)
+        self._writer.join(timeout)
+
+
+def load_sessions(path: str=_PATH, with_history: bool=True):
+    sessions = []
+    try:
+        f = open(path, 'r', encoding="utf-8")
+    except FileNotFoundError:
+        return sessions
+
+    with f:
+        for line in f:
+            if not with_history:
+                end = line.find(_HISTORY_KEY)
+                if end != -1:
+                    line = line[:end] + '}'
+            try:
+                sessions.append(json.loads(line))
+            except ValueError:
+                continue  # torn last line of a killed game
+    return sessions
+
+def aggregate_sessions(sessions: List[Dict]):
+    # per level: games, best and mean score, mean wpm, total play time
+    table = {}
+    for session in sessions:
+        row = table.setdefault(session.get("level", "unknown"), {
+            "games": 0,
+            "best_score": None,
+            "score_sum": 0,
+            "wpm_sum": 0.0,
+            "play_time": 0.0,
+        })
+        row["games"] += 1
+        row["best_score"] = session["score"] if row["best_score"] is None else max(row["best_score"], session["score"])
+        row["score_sum"] += session["score"]
+        row["wpm_sum"] += session["wpm"]
+        row["play_time"] += session["play_time"]
+
+    return {
+        level: {
+            "games": row["games"],
+            "best_score": row["best_score"],
+            "mean_score": row["score_sum"]/row["games"],
+            "mean_wpm": row["wpm_sum"]/row["games"],
+            "play_time": row["play_time"],
+        }
+        for level, row in table.items()
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    for level, row in aggregate_sessions(load_sessions(*sys.argv[1:2], with_history=False)).items():
+        print(f"{level:<8} " + " | ".join(f"{k}: {v:.2f}" if isinstance(v, float) else f"{k}: {v}" for k, v in row.items()))
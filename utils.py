@@ -1,16 +1,12 @@
-import random
+import os
 import json
-from collections import UserList
+from collections import OrderedDict, deque
 from enum import Enum
-from typing import Mapping
-from time import time
+from typing import Callable, Mapping
+from time import perf_counter
 from datetime import datetime, timezone, timedelta
+from threading import Thread
 
-import pygame
-
-
-with open("./words.txt", 'r') as f:
-    _WORDS = f.read().splitlines()
 
 GUIDE_CONTENT = '''/tower [position]:
     Add a tower to the given position.
@@ -27,6 +23,7 @@ class Colors(Enum):
     BLACK = (0, 0, 0)
     WHITE = (255, 255, 255)
     GRAY = (200, 200, 200)
+    DARK_GRAY = (70, 70, 70)
     GREEN = (0, 255, 0)
     YELLOW = (255, 255, 0)
     RED = (255, 0, 0)
@@ -41,12 +38,13 @@ class Fonts(Enum):
 class InfoTable:
     _CHECKPOING_INTERVAL = 5
 
-    def __init__(self):
+    def __init__(self, clock: Callable[[], float]):
         self.score = None
         self.wpm = None
         self._start_time = None
 
-        self._previous_ckpt_time = time()
+        self._clock = clock
+        self._previous_ckpt_time = clock()
         self._history = {
             "score": [],
             "wpm": [],
@@ -54,44 +52,387 @@ class InfoTable:
     
     @property
     def timer(self):
-        return time() - self._start_time
+        return self._clock() - self._start_time
     
     def reset(self):
         self.score = 0
         self.wpm = 0
-        self._start_time = time()
+        self._start_time = self._previous_ckpt_time = self._clock()
 
         for v in self._history.values():
             v.clear()
     
     def checkpoint(self):
-        if time() - self._previous_ckpt_time <= self._CHECKPOING_INTERVAL:
+        if self._clock() - self._previous_ckpt_time <= self._CHECKPOING_INTERVAL:
             return
         
-        self._previous_ckpt_time = time()
+        self._previous_ckpt_time = self._clock()
         self._history["score"].append(self.score)
         self._history["wpm"].append(self.wpm)
 
-    def save(self):
-        file_name = get_date()
-        with open(f"./history/{file_name}.json") as f:
-            json.dump(self._history, f)
+    def save(self, store, **extra):
+        # queued on the store's writer thread, see sessions.py
+        store.append({
+            "date": get_date(),
+            "play_time": self.timer,
+            "score": self.score,
+            "wpm": self.wpm,
+            **extra,
+            "history": {k: list(v) for k, v in self._history.items()},
+        })
 
 # utils
-class Queue(UserList):
+class Clock:
+    '''
+    game clock sampled once per frame, everything drawn in that frame reads `now`
+    instead of asking the os for the time again
+    '''
+    scale = 1.0  # game seconds per real second
+
+    def __init__(self):
+        self.now = 0.0
+
+    def _read(self) -> float:
+        raise NotImplementedError
+
+    def sample(self):
+        # returns the time passed since the previous sample
+        previous, self.now = self.now, self._read()
+        return self.now - previous
+
+class RealTimeClock(Clock):
+    def __init__(self):
+        super().__init__()
+        self._origin = perf_counter()
+
+    def _read(self):
+        return perf_counter() - self._origin
+
+class ScaledClock(RealTimeClock):
+    def __init__(self, scale: float):
+        super().__init__()
+        self.scale = scale
+
+    def _read(self):
+        return super()._read()*self.scale
+
+class ManualClock(Clock):
+    def __init__(self):
+        super().__init__()
+        self._time = 0.0
+
+    def advance(self, dt: float):
+        self._time += dt
+
+    def _read(self):
+        return self._time
+
+class FontRegistry:
+    '''
+    process-wide font cache keyed by (path, size),
+    pygame.font.Font parses the ttf file on every construction
+    '''
+    _fonts = {}
+    hits = 0
+    misses = 0
+    load_time = 0.0  # sec spent parsing ttf files
+
+    @classmethod
+    def get(cls, path: str, size: int):
+        key = (path, size)
+        font = cls._fonts.get(key)
+
+        if font is None:
+            # import inner so the headless simulation never loads pygame
+            import pygame
+
+            cls.misses += 1
+            start = perf_counter()
+            font = pygame.font.Font(path, size)
+            cls.load_time += perf_counter() - start
+            cls._fonts[key] = font
+        else:
+            cls.hits += 1
+
+        return font
+
+    @classmethod
+    def stats(cls):
+        return {
+            "fonts": len(cls._fonts),
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "load_ms": round(cls.load_time*1000, 2),
+        }
+
+    @classmethod
+    def clear(cls):
+        # fonts are invalid after pygame.quit()
+        cls._fonts.clear()
+        cls.hits = 0
+        cls.misses = 0
+        cls.load_time = 0.0
+
+class TextCache:
+    '''
+    bounded LRU cache of rendered text surfaces keyed by (font, text, color, antialias, background)
+    '''
+    _MAX_SIZE = 4096
+    _surfaces = OrderedDict()
+    hits = 0
+    misses = 0
+
+    @classmethod
+    def render(cls, font, text: str, antialias: bool, color, background=None):
+        key = (font, text, color, antialias, background)
+        surface = cls._surfaces.get(key)
+
+        if surface is not None:
+            cls.hits += 1
+            cls._surfaces.move_to_end(key)
+            return surface
+
+        cls.misses += 1
+        surface = font.render(text, antialias, color, background)
+        cls._surfaces[key] = surface
+        if len(cls._surfaces) > cls._MAX_SIZE:
+            cls._surfaces.popitem(last=False)
+
+        return surface
+
+    @classmethod
+    def stats(cls):
+        return {
+            "surfaces": len(cls._surfaces),
+            "hits": cls.hits,
+            "misses": cls.misses,
+        }
+
+    @classmethod
+    def clear(cls):
+        cls._surfaces.clear()
+        cls.hits = 0
+        cls.misses = 0
+
+class Queue:
+    '''
+    FIFO queue backed by collections.deque, O(1) at both ends.
+    an entry removed from the middle leaves a tombstone, so iterating
+    stays valid while elements are removed
+    '''
+    _REMOVED = object()
+
+    def __init__(self, iterable=()):
+        self._data = deque(iterable)
+        self._size = len(self._data)
+        self._popped = 0  # entries dropped from the left, keeps running iterators aligned
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        i, popped = 0, self._popped
+        while True:
+            i = max(i - (self._popped - popped), 0)
+            popped = self._popped
+            if i >= len(self._data):
+                return
+
+            item = self._data[i]
+            i += 1
+            if item is not self._REMOVED:
+                yield item
+
+    def __contains__(self, value):
+        return any(item == value for item in self)
+
     @property
     def head(self):
-        try:
-            return self.data[0]
-        except IndexError:
-            return None
+        return self._data[0] if self._data else None
     
     @property
     def tail(self):
-        try:
-            return self.data[-1]
-        except IndexError:
-            return None
+        return self._data[-1] if self._data else None
+
+    def append(self, item):
+        self._data.append(item)
+        self._size += 1
+
+    def popleft(self):
+        if not self._data:
+            raise IndexError("pop from an empty queue")
+
+        item = self._data.popleft()
+        self._popped += 1
+        self._size -= 1
+        self._trim()
+        return item
+
+    def pop(self):
+        if not self._data:
+            raise IndexError("pop from an empty queue")
+
+        item = self._data.pop()
+        self._size -= 1
+        self._trim()
+        return item
+
+    def remove_item(self, item):
+        # identity first, entity slots are plain ints compared by value
+        for i, entry in enumerate(self._data):
+            if entry is not item and entry != item:
+                continue
+
+            if i == 0:
+                self.popleft()
+            elif i == len(self._data) - 1:
+                self.pop()
+            else:
+                self._data[i] = self._REMOVED
+                self._size -= 1
+            return
+
+        raise ValueError("item not in queue")
+
+    def _trim(self):
+        # keep both ends free of tombstones so head and tail stay O(1)
+        while self._data and self._data[0] is self._REMOVED:
+            self._data.popleft()
+            self._popped += 1
+        while self._data and self._data[-1] is self._REMOVED:
+            self._data.pop()
+
+    def clear(self):
+        self._popped += len(self._data)
+        self._data.clear()
+        self._size = 0
+
+class NullProfiler:
+    enabled = False
+
+    def begin_frame(self):
+        pass
+
+    def mark(self, stage: str):
+        pass
+
+    def end_frame(self):
+        pass
+
+class FrameProfiler:
+    '''
+    per-stage frame timings. mark() closes the stage that ran since the previous mark,
+    so instrumented code only pays one call per stage, and nothing beyond an empty
+    call while the NullProfiler is installed
+    '''
+    enabled = True
+
+    _WINDOW = 60  # frames in the rolling average
+    _TRACE_MAX = 100_000
+
+    def __init__(self):
+        self.frame = 0
+        self.trace = deque(maxlen=self._TRACE_MAX)
+        self._window = deque(maxlen=self._WINDOW)
+        self._stages = {}
+        self._frame_start = self._last_mark = perf_counter()
+
+    def begin_frame(self):
+        self._frame_start = self._last_mark = perf_counter()
+        self._stages = {}
+
+    def mark(self, stage: str):
+        now = perf_counter()
+        self._stages[stage] = self._stages.get(stage, 0.0) + now - self._last_mark
+        self._last_mark = now
+
+    def end_frame(self):
+        record = {
+            "frame": self.frame,
+            "start": self._frame_start,
+            "total": perf_counter() - self._frame_start,
+            "stages": self._stages,
+        }
+        self.trace.append(record)
+        self._window.append(record)
+        self.frame += 1
+
+    def averages(self):
+        # rolling mean per stage in ms
+        stage_sum = {}
+        for record in self._window:
+            for stage, t in record["stages"].items():
+                stage_sum[stage] = stage_sum.get(stage, 0.0) + t
+        n = max(len(self._window), 1)
+        return {stage: t/n*1000 for stage, t in stage_sum.items()}
+
+    @property
+    def fps(self):
+        if len(self._window) < 2:
+            return 0.0
+        elapsed = self._window[-1]["start"] - self._window[0]["start"]
+        return (len(self._window) - 1)/elapsed if elapsed > 0 else 0.0
+
+    def export(self, path: str=None):
+        if path is None:
+            path = f"./profile/{get_date()}.json"
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(list(self.trace), f)
+        return path
+
+class StartupProfiler:
+    '''
+    wall time of the startup stages, mark() closes the stage that ran since the
+    previous mark, background tasks are added with their own durations
+    '''
+    def __init__(self, start: float=None):
+        self.start = perf_counter() if start is None else start
+        self.stages = []      # (stage, sec, sec since start)
+        self.background = []  # (task, sec)
+        self._last_mark = self.start
+
+    def mark(self, stage: str):
+        now = perf_counter()
+        self.stages.append((stage, now - self._last_mark, now - self.start))
+        self._last_mark = now
+
+    def report(self):
+        lines = ["startup profile (ms)", f"  {'stage':<24}{'took':>9}{'at':>9}"]
+        lines += [f"  {stage:<24}{t*1000:9.1f}{at*1000:9.1f}" for stage, t, at in self.stages]
+        if self.background:
+            lines.append("  background")
+            lines += [f"    {task:<22}{t*1000:9.1f}" for task, t in self.background]
+        font_stats = FontRegistry.stats()
+        lines.append(f"  fonts: {font_stats['fonts']} loaded in {font_stats['load_ms']} ms")
+        return "\n".join(lines)
+
+class BackgroundLoader(Thread):
+    '''
+    runs slow loading tasks off the main thread while the menus are shown,
+    wait() blocks until they are done and re-raises the first error
+    '''
+    def __init__(self, tasks: Mapping[str, Callable], profiler: StartupProfiler=None):
+        super().__init__(daemon=True)
+        self.tasks = tasks
+        self.profiler = profiler
+        self.error = None
+
+    def run(self):
+        for name, task in self.tasks.items():
+            start = perf_counter()
+            try:
+                task()
+            except Exception as e:
+                self.error = e
+                return
+            if self.profiler is not None:
+                self.profiler.background.append((name, perf_counter() - start))
+
+    def wait(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
 
 class PygameFunction:
     KEY_BACKSPACE = "backspace"
@@ -99,6 +440,8 @@ class PygameFunction:
 
     @classmethod
     def read_key(cls, event):
+        import pygame
+
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_BACKSPACE:
                 return cls.KEY_BACKSPACE
@@ -117,25 +460,18 @@ def time_format(t: float):
 def get_date():
     return datetime.now(timezone(timedelta(hours=+8))).strftime("%Y-%m-%d_%H-%M")
 
-def get_word():
-    return random.choice(_WORDS)
-
-
-# visualize
-def plot_history(history: Mapping, play_time: float):
-    # import inner for speed up game loading
-    import matplotlib.pyplot as plt
+# import inner so loading utils never touches the word list
+def get_word_id(rng=None, level: str=None):
+    from vocabulary import get_vocabulary
+    return get_vocabulary().sample(rng, level)
 
-    fig, axes = plt.subplots(1, 2, figsize=(11, 4))
+def get_word(word_id: int=None):
+    from vocabulary import get_vocabulary
+    if word_id is None:
+        word_id = get_word_id()
+    return get_vocabulary().words[word_id]
 
-    for i, (ax, (k, v)) in enumerate(zip(axes, history.items())):
-        color = f"C{i}"
-        x = [play_time/len(v)*i for i in range(len(v))]
-        ax.plot(x, v, marker='o', color=color)
-        ax.set_ylabel(k.title() if i == 0 else k.upper())
-        ax.set_xlabel("Time (s)")
-        ax.grid(True)
-    fig.suptitle("Performance")
-    fig.canvas.manager.set_window_title("Visualizer")
+def get_word_score(word_id: int):
+    from vocabulary import get_vocabulary
+    return get_vocabulary().score(word_id)
 
-    plt.show()
@@ -0,0 +1,52 @@
+'''
+draws the performance history to a png in its own process, so matplotlib is
+never imported into the game and plotting never stalls a frame
+
+    python visualizer.py out.png < history.json
+'''
+import json
+import sys
+from typing import List, Mapping, Tuple
+
+from sessions import load_sessions
+
+
+def plot_history(history: Mapping, play_time: float, path: str, size: Tuple[int, int]=(1000, 500), sessions: List[Mapping]=None):
+    import matplotlib
+    matplotlib.use("Agg")  # no window, the game blits the png
+    import matplotlib.pyplot as plt
+
+    dpi = 100
+    rows = 2 if sessions else 1
+    fig, axes = plt.subplots(rows, 2, figsize=(size[0]/dpi, size[1]/dpi), dpi=dpi, squeeze=False)
+
+    for i, (ax, (k, v)) in enumerate(zip(axes[0], history.items())):
+        color = f"C{i}"
+        x = [play_time/len(v)*i for i in range(len(v))]
+        ax.plot(x, v, marker='o', color=color)
+        ax.set_ylabel(k.title() if i == 0 else k.upper())
+        ax.set_xlabel("Time (s)")
+        ax.grid(True)
+
+    if sessions:
+        # one point per finished game, the current one last
+        for i, (ax, k) in enumerate(zip(axes[1], ("score", "wpm"))):
+            ax.plot([session[k] for session in sessions], color=f"C{i}")
+            ax.set_ylabel(k.title() if i == 0 else k.upper())
+            ax.set_xlabel("Game")
+            ax.grid(True)
+    fig.suptitle("Performance")
+    fig.tight_layout()
+
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def main():
+    request = json.load(sys.stdin)
+    sessions = load_sessions(request["sessions"], with_history=False) if request.get("sessions") else None
+    plot_history(request["history"], request["play_time"], sys.argv[1], tuple(request["size"]), sessions)
+
+
+if __name__ == "__main__":
+    main()
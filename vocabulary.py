@@ -0,0 +1,223 @@
+'''
+precomputed vocabulary: length, score tier and letter-frequency difficulty of
+every word, built once from words.txt and cached until the list changes, so
+spawning a word is an array lookup and sampling a level's tiers is O(1)
+
+the cache is one packed file that is memory-mapped, never parsed:
+
+    header | offsets int64[n+1] | lengths int32[n] | by_tier int32[n] | difficulty float32[n] | tiers int8[n] | utf-8 words
+
+so startup time and memory stay flat however long the word list is, a word is
+only decoded when it is spawned
+'''
+import os
+import tempfile
+from typing import List
+
+import numpy as np
+
+_SOURCE = "./words.txt"
+_CACHE_DIR = "./.cache"
+
+
+class PackedWords:
+    '''
+    read-only list of words stored back to back in one utf-8 buffer
+    '''
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @classmethod
+    def pack(cls, words: List[str]):
+        encoded = [word.encode("utf-8") for word in words]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+
+class Vocabulary:
+    EASY = 0
+    MEDIUM = 1
+    HARD = 2
+
+    '''
+    1. (5, 12)
+        easy:       [2, 4]       11.70%
+        medium:     [5, 11]      84.80%
+        hard:       [12, 16]      4.40%
+    2. (7, 10) - more reasonable
+        easy:       [2, 6]       39.97%
+        medium:     [7, 9]       42.23%
+        hard:       [10, 16]     18.70%
+    '''
+
+    _EASY_THRESHOLD = 7
+    _HARD_THRESHOLD = 10
+    _TIER_SCORES = np.array([3, 5, 10], dtype=np.int32)
+
+    # share of easy | medium | hard words spawned per level
+    _LEVEL_TIER_WEIGHTS = {
+        "easy": (0.6, 0.3, 0.1),
+        "medium": (0.4, 0.42, 0.18),
+        "hard": (0.2, 0.4, 0.4),
+    }
+
+    _FORMAT_VERSION = 2
+    _MAGIC = b"WGVOCAB\0"
+    _HEADER = 12  # int64: magic, key[5], n, tier bounds[4], blob size
+
+    def __init__(self, words: PackedWords, lengths: np.ndarray, tiers: np.ndarray, difficulty: np.ndarray, by_tier: np.ndarray=None, tier_bounds: List[int]=None):
+        self.words = words
+        self.lengths = lengths
+        self.tiers = tiers
+        self.difficulty = difficulty  # mean bits per letter, rare letters are harder to type
+
+        # word ids grouped by tier, tier t is by_tier[tier_bounds[t]:tier_bounds[t + 1]]
+        if by_tier is None:
+            by_tier = np.argsort(tiers, kind="stable").astype(np.int32)
+            tier_bounds = [0] + np.cumsum(np.bincount(tiers, minlength=len(self._TIER_SCORES))).tolist()
+        self.by_tier = by_tier
+        self.tier_bounds = tier_bounds
+
+        self._level_cdf = {}
+        for level, weights in self._LEVEL_TIER_WEIGHTS.items():
+            # empty tiers never get picked
+            weights = np.array(weights)*(np.diff(self.tier_bounds) > 0)
+            self._level_cdf[level] = (np.cumsum(weights)/weights.sum()).tolist()
+        self._rng = np.random.default_rng()
+
+    def __len__(self):
+        return len(self.words)
+
+    def score(self, word_id: int):
+        return int(self._TIER_SCORES[self.tiers[word_id]])
+
+    @classmethod
+    def tier_of(cls, length):
+        return np.digitize(length, [cls._EASY_THRESHOLD, cls._HARD_THRESHOLD])
+
+    @classmethod
+    def build(cls, words: List[str]):
+        lengths = np.fromiter(map(len, words), dtype=np.int32, count=len(words))
+        tiers = cls.tier_of(lengths).astype(np.int8)
+
+        # letter information content, averaged per word
+        codes = np.frombuffer("".join(words).encode("utf-32-le"), dtype=np.uint32)
+        _, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+        bits = -np.log2(counts/len(codes))
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        difficulty = (np.add.reduceat(bits[inverse], starts)/lengths).astype(np.float32)
+
+        return cls(PackedWords.pack(words), lengths, tiers, difficulty)
+
+    @classmethod
+    def _cache_key(cls, source: str):
+        stat = os.stat(source)
+        return [cls._FORMAT_VERSION, stat.st_mtime_ns, stat.st_size, cls._EASY_THRESHOLD, cls._HARD_THRESHOLD]
+
+    @classmethod
+    def load(cls, source: str=_SOURCE, cache_dir: str=_CACHE_DIR):
+        key = cls._cache_key(source)
+        cache_path = os.path.join(cache_dir, os.path.basename(source) + ".vocab")
+        try:
+            return cls.open(cache_path, key)
+        except (OSError, ValueError):
+            pass  # missing, stale or mid-replace cache, rebuild it
+
+        with open(source, 'r', encoding="utf-8") as f:
+            vocabulary = cls.build([word for word in f.read().splitlines() if word])
+        try:
+            vocabulary.save(cache_path, key)
+            return cls.open(cache_path, key)  # drop the built copy for the mapped one
+        except (OSError, ValueError):
+            return vocabulary  # read-only install, or another process replaced it meanwhile
+
+    @classmethod
+    def open(cls, path: str, key: List[int]=None):
+        data = np.memmap(path, dtype=np.uint8, mode='r').view(np.ndarray)  # plain views index faster
+        header = data[:cls._HEADER*8].view(np.int64)
+        if data[:8].tobytes() != cls._MAGIC or (key is not None and header[1:6].tolist() != key):
+            raise ValueError(f"Error: {path} is stale or not a vocabulary cache")
+        n = int(header[6])
+        tier_bounds = header[7:11].tolist()
+
+        sections = {}
+        pos = cls._HEADER*8
+        for name, dtype, size in (
+            ("offsets", np.int64, n + 1),
+            ("lengths", np.int32, n),
+            ("by_tier", np.int32, n),
+            ("difficulty", np.float32, n),
+            ("tiers", np.int8, n),
+            ("blob", np.uint8, int(header[11])),
+        ):
+            nbytes = size*np.dtype(dtype).itemsize
+            sections[name] = data[pos:pos + nbytes].view(dtype)
+            pos += nbytes
+        if pos != len(data):
+            raise ValueError(f"Error: {path} is truncated")
+
+        words = PackedWords(sections["blob"], sections["offsets"])
+        return cls(words, sections["lengths"], sections["tiers"], sections["difficulty"], sections["by_tier"], tier_bounds)
+
+    def save(self, path: str, key: List[int]):
+        header = np.zeros(self._HEADER, dtype=np.int64)
+        header[0] = np.frombuffer(self._MAGIC, dtype=np.int64)[0]
+        header[1:6] = key
+        header[6] = len(self)
+        header[7:11] = self.tier_bounds
+        header[11] = len(self.words.blob)
+
+        # a temp file per writer, processes rebuilding a cold cache together must not share one
+        cache_dir = os.path.dirname(path) or '.'
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=os.path.basename(path) + '.', suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for array in (header, self.words.offsets, self.lengths, self.by_tier, self.difficulty, self.tiers, self.words.blob):
+                    f.write(np.ascontiguousarray(array).tobytes())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def sample(self, rng: np.random.Generator=None, level: str=None):
+        if rng is None:
+            rng = self._rng
+
+        cdf = self._level_cdf.get(level)
+        if cdf is None:
+            return int(rng.integers(len(self.words)))
+
+        r = rng.random()
+        tier = 0
+        while tier < len(cdf) - 1 and cdf[tier] <= r:
+            tier += 1
+        start, end = self.tier_bounds[tier], self.tier_bounds[tier + 1]
+        return int(self.by_tier[start + rng.integers(end - start)])
+
+
+_VOCABULARY = None
+
+def get_vocabulary():
+    global _VOCABULARY
+    if _VOCABULARY is None:
+        _VOCABULARY = Vocabulary.load()
+    return _VOCABULARY
+
+def use_vocabulary(source: str):
+    # switch to another word list, in the words.txt format
+    global _VOCABULARY
+    _VOCABULARY = Vocabulary.load(source)
+    return _VOCABULARY